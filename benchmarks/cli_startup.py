@@ -0,0 +1,133 @@
+"""
+Measures the startup time of the `edd` CLI, failing if it goes over the budget.
+
+The budget is for the time `edd_cli.cli` takes to import on top of typer, which
+the CLI can't avoid, so it does not depend much on the machine. Importing the CLI
+must not import the modules every command doesn't need, like pydantic or the
+runners: commands import them when they run.
+
+    python benchmarks/cli_startup.py [--runs 10] [--budget-ms 40] [--json]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from statistics import median
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that only some commands use
+LAZY_MODULES = [
+    "pydantic.main",
+    "edd_cli.finder",
+    "edd_cli.runner.run",
+    "edd_cli.runner.temp_dirs",
+    "edd_cli.runner.runners.usage",
+    "edd_cli.schema.results",
+    "edd_cli.cache",
+    "edd_cli.server",
+    "concurrent.futures.process",
+    "rich.progress",
+]
+
+IMPORT_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure_import(module: str, runs: int):
+    "Imports the module in `runs` new interpreters, returning the times and modules."
+    times: list[float] = []
+    modules: set[str] = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(module=module)],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output)
+        times.append(result["seconds"])
+        modules = set(result["modules"])
+    return times, modules
+
+
+def measure_help(runs: int):
+    "Runs `edd --help` in `runs` new interpreters, returning the wall times."
+    script = (
+        "import subprocess, sys, time\n"
+        "start = time.perf_counter()\n"
+        "subprocess.run([sys.executable, '-m', 'edd_cli', '--help'],"
+        " check=True, capture_output=True)\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    return [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=ROOT,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        )
+        for _ in range(runs)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=40,
+        help="Maximum median import time of the CLI on top of typer",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    typer_times, _ = measure_import("typer", args.runs)
+    cli_times, cli_modules = measure_import("edd_cli.cli", args.runs)
+    help_times = measure_help(args.runs)
+
+    overhead_ms = (median(cli_times) - median(typer_times)) * 1000
+    eager = [module for module in LAZY_MODULES if module in cli_modules]
+    results = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "typer_import_ms": median(typer_times) * 1000,
+        "cli_import_ms": median(cli_times) * 1000,
+        "cli_overhead_ms": overhead_ms,
+        "help_wall_ms": median(help_times) * 1000,
+        "budget_ms": args.budget_ms,
+        "eager_modules": eager,
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"import typer        {results['typer_import_ms']:8.1f} ms")
+        print(f"import edd_cli.cli  {results['cli_import_ms']:8.1f} ms")
+        print(f"  over typer        {overhead_ms:8.1f} ms (budget {args.budget_ms} ms)")
+        print(f"edd --help          {results['help_wall_ms']:8.1f} ms")
+
+    failed = False
+    if overhead_ms > args.budget_ms:
+        print(f"CLI import is over the budget by {overhead_ms - args.budget_ms:.1f} ms")
+        failed = True
+    if eager:
+        print(f"Imported by the CLI but used only by some commands: {', '.join(eager)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Benchmarks the orchestration of a grading run, reporting the time of each phase.
+
+Generates synthetic test suites and a repository, and grades them with an
+in-process runner that does not run any command, so only the work of the
+orchestrator is measured:
+
+- discovery: parsing the suite (or loading its manifest, with `--manifest`)
+- resolving: resolving the paths and globs of each stage
+- hashing: computing the stage keys, hashing the files
+- staging: creating, copying and publishing the stage directories
+- execution: the fake runner, writing the outputs of the stage
+- results: reading the outputs and usage of each stage into the results
+
+Each scenario is run with a cold cache (new cache directory) and then with the
+warm cache left by the cold run. The results are printed and written as JSON
+with `--output`, and `--compare` prints the change against a previous output.
+With `--max-regression`, it fails if the total time of a scenario grew more than
+that percentage over the compared output.
+
+    python benchmarks/orchestration.py [--scenario many-tests] [--repeat 3]
+        [--output results.json] [--compare baseline.json] [--max-regression 20]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
+from statistics import median
+from threading import Lock, local
+from time import perf_counter, time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from edd_cli.cache import HASH_INDEX_FILE, FileHashIndex  # noqa: E402
+from edd_cli.finder import compile_suite, load_suite  # noqa: E402
+from edd_cli.runner import (  # noqa: E402
+    AbstractRunner,
+    Orchestrator,
+    TempDirGeneratorFactory,
+    environment,
+    temp_dirs,
+)
+from edd_cli.runner.runners.usage import write_usage  # noqa: E402
+from edd_cli.schema.results import ResourceUsage  # noqa: E402
+from edd_cli.schema.tests import TestStage  # noqa: E402
+
+PHASES = ["discovery", "resolving", "hashing", "staging", "execution", "results"]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    groups: int
+    tests: int
+    input_size: int = 1024
+    data_files: int = 0
+    repo_files: int = 20
+    repo_file_size: int = 4096
+    artifact_size: int = 64 * 1024
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario("many-tests", groups=4, tests=250),
+        Scenario("many-groups", groups=100, tests=4),
+        Scenario("large-inputs", groups=2, tests=10, input_size=8 * 1024 * 1024),
+        Scenario("glob-includes", groups=4, tests=50, data_files=40),
+    ]
+}
+
+
+class PhaseTimer:
+    """
+    Adds up the time spent in each phase. Phases called inside other phases are
+    not counted in the outer one, so the phases never overlap.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._local = local()
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+
+    @contextmanager
+    def phase(self, name: str):
+        stack: list[list[float]] = self._local.__dict__.setdefault("stack", [])
+        stack.append([perf_counter(), 0.0])
+        try:
+            yield
+        finally:
+            start, nested = stack.pop()
+            elapsed = perf_counter() - start
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                self.totals[name] += elapsed - nested
+                self.calls[name] += 1
+
+    def wrap(self, owner, attribute: str, name: str):
+        "Times every call of the attribute of `owner`, returning the original."
+        original = getattr(owner, attribute)
+
+        @wraps(original)
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return original(*args, **kwargs)
+
+        setattr(owner, attribute, timed)
+        return original
+
+
+@contextmanager
+def instrumented(timer: PhaseTimer):
+    "Times the orchestration hot path while active."
+    targets = [
+        (TestStage, "with_resolved_paths", "resolving"),
+        (environment, "assert_all_files_exist", "resolving"),
+        (temp_dirs.TempDirGenerator, "_stage_key", "hashing"),
+        (temp_dirs.TempDirGenerator, "create", "staging"),
+        (temp_dirs.TempDir, "prepare", "staging"),
+        (temp_dirs.TempDir, "finish", "staging"),
+        (environment.Environment, "_add_current_step_usage", "results"),
+        (environment.Environment, "get_result", "results"),
+    ]
+    originals = [
+        (owner, attribute, timer.wrap(owner, attribute, name))
+        for owner, attribute, name in targets
+    ]
+    try:
+        yield
+    finally:
+        for owner, attribute, original in originals:
+            setattr(owner, attribute, original)
+
+
+class FakeRunner(AbstractRunner):
+    """
+    Writes the outputs of a stage without running its command: `build` writes a
+    `program` of `artifact_size` bytes, and every command prints a full score.
+    """
+
+    def __init__(self, timer: PhaseTimer, artifact_size: int):
+        self._timer = timer
+        self._artifact = b"\0" * artifact_size
+
+    def run(self, command: list[str], dir: Path):
+        with self._timer.phase("execution"):
+            if command[0] == "build":
+                dir.joinpath("program").write_bytes(self._artifact)
+            dir.joinpath(f".stdout.{dir.name}").write_text("1")
+            usage = ResourceUsage(
+                wall_time=0, user_time=0, system_time=0, max_rss=0, exit_code=0
+            )
+            write_usage(dir, usage)
+
+
+def generate_suite(scenario: Scenario, suite_dir: Path):
+    "Writes `groups` groups of `tests` tests, in the format read by the finder."
+    for g in range(scenario.groups):
+        group_dir = suite_dir / f"group-{g}"
+        group_dir.mkdir(parents=True)
+        (group_dir / "lib").mkdir()
+        (group_dir / "lib" / "checker.h").write_text("// checker\n")
+        _write_json(
+            group_dir / "setup.json",
+            {
+                "name": f"group-{g}",
+                "steps": [
+                    {
+                        "require": ["src/*.c", "Makefile"],
+                        "include": ["lib/*.h"],
+                        "command": ["build"],
+                    }
+                ],
+            },
+        )
+        for t in range(scenario.tests):
+            test_dir = group_dir / f"test-{t}"
+            test_dir.mkdir()
+            (test_dir / "input.txt").write_bytes(_content(t, scenario.input_size))
+            include: list = [{"source": "input.txt", "target": "input.txt"}]
+            if scenario.data_files:
+                (test_dir / "data").mkdir()
+                for d in range(scenario.data_files):
+                    (test_dir / "data" / f"{d}.txt").write_text(f"{t} {d}\n")
+                include.append("data/*.txt")
+            _write_json(
+                test_dir / "test.json",
+                {
+                    "name": f"test-{t}",
+                    "steps": [
+                        {
+                            "require": ["program"],
+                            "include": include,
+                            "command": ["check"],
+                            "time_it": True,
+                        }
+                    ],
+                },
+            )
+
+
+def generate_repository(scenario: Scenario, repo_dir: Path):
+    (repo_dir / "src").mkdir(parents=True)
+    (repo_dir / "Makefile").write_text("all:\n\tcc src/*.c -o program\n")
+    for i in range(scenario.repo_files):
+        (repo_dir / "src" / f"{i}.c").write_bytes(_content(i, scenario.repo_file_size))
+
+
+def run_once(
+    scenario: Scenario,
+    suite_dir: Path,
+    repo_dir: Path,
+    factory: TempDirGeneratorFactory,
+):
+    "Grades the repository once, returning the time of each phase in seconds."
+    timer = PhaseTimer()
+    start = perf_counter()
+    with instrumented(timer):
+        with timer.phase("discovery"):
+            groups, _ = load_suite(suite_dir)
+        dir_generator = factory.create(cache=True, subpath=Path("bench", "user"))
+        runner = FakeRunner(timer, scenario.artifact_size)
+        results = Orchestrator(repo_dir, runner, dir_generator).run(groups)
+    total = perf_counter() - start
+
+    tests = [test for group in results for test in getattr(group, "results", [])]
+    failed = [test for test in tests if test.verdict != "ok"]
+    failed += [group for group in results if group.verdict != "ok"]
+    if failed:
+        raise RuntimeError(f"Benchmark run failed: {failed[0]}")
+
+    phases = {phase: timer.totals[phase] for phase in PHASES}
+    phases["other"] = max(total - sum(phases.values()), 0)
+    return {"total": total, "phases": phases, "stages": timer.calls["hashing"]}
+
+
+def run_scenario(scenario: Scenario, work_dir: Path, args: argparse.Namespace):
+    suite_dir = work_dir / scenario.name / "suite"
+    repo_dir = work_dir / scenario.name / "repo"
+    shutil.rmtree(work_dir / scenario.name, ignore_errors=True)
+    generate_suite(scenario, suite_dir)
+    generate_repository(scenario, repo_dir)
+    # as if written long ago, files modified in the last seconds are always hashed
+    for path in [*suite_dir.rglob("*"), *repo_dir.rglob("*")]:
+        os.utime(path, (time() - 3600, time() - 3600))
+    if args.manifest:
+        compile_suite(suite_dir)
+
+    runs: dict[str, list[dict]] = {"cold": [], "warm": []}
+    for i in range(args.repeat):
+        cache_dir = work_dir / scenario.name / f"cache-{i}"
+        factory = TempDirGeneratorFactory(
+            cache_dir, link_include=args.link_include, deduplicate=args.deduplicate
+        )
+        runs["cold"].append(run_once(scenario, suite_dir, repo_dir, factory))
+        runs["warm"].append(run_once(scenario, suite_dir, repo_dir, factory))
+        # saved now, or it would be saved at exit, creating the directory again
+        FileHashIndex.for_path(cache_dir / HASH_INDEX_FILE).save()
+        shutil.rmtree(cache_dir)
+
+    return {
+        "scenario": asdict(scenario),
+        "cache": {
+            cache: {
+                "runs": cache_runs,
+                "median": {
+                    "total": median(run["total"] for run in cache_runs),
+                    **{
+                        phase: median(run["phases"][phase] for run in cache_runs)
+                        for phase in [*PHASES, "other"]
+                    },
+                },
+            }
+            for cache, cache_runs in runs.items()
+        },
+    }
+
+
+def print_results(results: list[dict], baseline: dict | None):
+    previous = {
+        (result["scenario"]["name"], cache): data["median"]
+        for result in (baseline or {}).get("results", [])
+        for cache, data in result["cache"].items()
+    }
+    columns = ["total", *PHASES, "other"]
+    print(f"{'scenario':<16}{'cache':<6}" + "".join(f"{c:>11}" for c in columns))
+    for result in results:
+        for cache, data in result["cache"].items():
+            name = result["scenario"]["name"]
+            cells = [f"{data['median'][c] * 1000:9.1f}ms" for c in columns]
+            print(f"{name:<16}{cache:<6}" + " ".join(cells))
+            if (name, cache) in previous:
+                before = previous[(name, cache)]
+                changes = [_change(before.get(c), data["median"][c]) for c in columns]
+                print(f"{'':<16}{'vs':<6}" + " ".join(f"{c:>10}" for c in changes))
+
+
+def find_regressions(results: list[dict], baseline: dict, max_regression: float):
+    "Returns the scenarios whose total time grew more than `max_regression` percent."
+    previous = {
+        (result["scenario"]["name"], cache): data["median"]["total"]
+        for result in baseline.get("results", [])
+        for cache, data in result["cache"].items()
+    }
+    regressions: list[str] = []
+    for result in results:
+        for cache, data in result["cache"].items():
+            name = result["scenario"]["name"]
+            before = previous.get((name, cache))
+            after = data["median"]["total"]
+            if before and (after - before) / before * 100 > max_regression:
+                regressions.append(
+                    f"{name} ({cache}): {before * 1000:.1f}ms -> {after * 1000:.1f}ms"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="Scenarios to run, every one by default",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each scenario")
+    parser.add_argument("--manifest", action="store_true", help="Compile the suites")
+    parser.add_argument("--link-include", action="store_true")
+    parser.add_argument("--deduplicate", action="store_true")
+    parser.add_argument("--work-dir", type=Path, help="Keeps the generated files")
+    parser.add_argument("--output", type=Path, help="Writes the results as JSON")
+    parser.add_argument("--compare", type=Path, help="JSON output of a previous run")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="Fails if a total is slower than in --compare by more than this percent",
+    )
+    args = parser.parse_args()
+    if args.max_regression is not None and args.compare is None:
+        parser.error("--max-regression requires --compare")
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    scenarios = [SCENARIOS[name] for name in args.scenario or SCENARIOS]
+    work_dir = (args.work_dir or Path(tempfile.mkdtemp(prefix="edd-bench-"))).resolve()
+    try:
+        results = [run_scenario(s, work_dir, args) for s in scenarios]
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results, baseline)
+    if args.output:
+        output = {
+            "version": _git_version(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "options": {
+                "repeat": args.repeat,
+                "manifest": args.manifest,
+                "link_include": args.link_include,
+                "deduplicate": args.deduplicate,
+            },
+            "results": results,
+        }
+        args.output.write_text(json.dumps(output, indent=2))
+
+    if baseline is not None and args.max_regression is not None:
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print(f"Slower by more than {args.max_regression:g}%:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+
+def _content(seed: int, size: int):
+    line = f"{seed} lorem ipsum dolor sit amet\n".encode()
+    return (line * (size // len(line) + 1))[:size]
+
+
+def _write_json(path: Path, data):
+    path.write_text(json.dumps(data))
+
+
+def _change(before: float | None, after: float):
+    if not before:
+        return "-"
+    return f"{(after - before) / before:+.0%}"
+
+
+def _git_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+from .blobs import BLOBS_DIR, BlobStore
+from .eviction import CacheEvictor, remove_entry, remove_unused
+from .hash_index import HASH_INDEX_FILE, FileHashIndex
+from .index import INDEX_FILE, CacheIndex
+
+__all__ = [
+    "BlobStore",
+    "BLOBS_DIR",
+    "CacheEvictor",
+    "CacheIndex",
+    "FileHashIndex",
+    "HASH_INDEX_FILE",
+    "INDEX_FILE",
+    "remove_entry",
+    "remove_unused",
+]
@@ -0,0 +1,115 @@
+import os
+import shutil
+import stat
+from logging import getLogger
+from pathlib import Path
+
+from ..utils.files import WRITE_BITS
+from .hash_index import FileHashIndex
+from .index import CacheIndex
+
+logger = getLogger(__name__)
+
+BLOBS_DIR = ".blobs"
+
+
+class BlobStore:
+    """
+    Content-addressed store for the files of finished stage directories.
+    Stage files are replaced by read-only hardlinks to their blob, so identical
+    files are stored once. The link count of a blob is its reference count.
+    The blobs are counted once, in the entry of the store in the `index` (hidden,
+    so it is never evicted), and stages only count their files without other links.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        hash_index: FileHashIndex,
+        *,
+        min_size=4096,
+        index: CacheIndex | None = None,
+    ):
+        self.path = path
+        self._hash_index = hash_index
+        self._min_size = min_size
+        self._index = index
+
+    def deduplicate(self, dir: Path):
+        "Moves every file of the directory into the store, linking it back."
+        for file in dir.rglob("*"):
+            if file.is_symlink() or not file.is_file():
+                continue
+            file_stat = file.stat()
+            if file_stat.st_size < self._min_size or file_stat.st_nlink > 1:
+                continue
+            try:
+                self._store(file, stat.S_IMODE(file_stat.st_mode))
+            except OSError as error:
+                logger.warning(f"Failed to deduplicate {file}: {error}")
+
+    def collect_garbage(self) -> int:
+        "Removes the blobs not used by any stage directory, returns the freed bytes."
+        freed = 0
+        for blob in self.path.glob("*/*"):
+            blob_stat = blob.stat()
+            if blob_stat.st_nlink == 1:
+                blob.unlink()
+                freed += blob_stat.st_size
+        logger.info(f"Removed {freed} bytes of unused blobs")
+        if self._index is not None:
+            self._index.grow(self.path, -freed)
+        return freed
+
+    def remove(self, dir: Path) -> int:
+        """
+        Removes the stage directory and the blobs only it used, without walking the
+        store. Returns the freed bytes of the blobs.
+        """
+        blobs: list[Path] = []
+        for file in dir.rglob("*"):
+            if file.is_symlink() or not file.is_file():
+                continue
+            file_stat = file.stat()
+            if file_stat.st_nlink != 2:
+                continue
+            blob = self._blob_path(file, stat.S_IMODE(file_stat.st_mode))
+            if blob.is_file() and os.path.samefile(blob, file):
+                blobs.append(blob)
+
+        shutil.rmtree(dir, ignore_errors=True)
+        freed = 0
+        for blob in blobs:
+            try:
+                blob_stat = blob.stat()
+            except FileNotFoundError:
+                continue
+            if blob_stat.st_nlink == 1:
+                blob.unlink()
+                freed += blob_stat.st_size
+        if self._index is not None:
+            self._index.grow(self.path, -freed)
+        return freed
+
+    def _blob_path(self, file: Path, mode: int):
+        digest = self._hash_index.digest(file).hex()
+        executable = "x" if mode & stat.S_IXUSR else "r"
+        return self.path / digest[:2] / f"{digest}.{executable}"
+
+    def _store(self, file: Path, mode: int):
+        blob = self._blob_path(file, mode)
+
+        if not blob.exists():
+            file.chmod(mode & ~WRITE_BITS)
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(file, blob)
+                if self._index is not None:
+                    self._index.grow(self.path, blob.stat().st_size)
+                return
+            except FileExistsError:
+                pass  # stored at the same time by another worker
+
+        temp_link = file.with_name(f".{file.name}.blob")
+        os.link(blob, temp_link)
+        os.replace(temp_link, file)
@@ -0,0 +1,99 @@
+import shutil
+from logging import getLogger
+from pathlib import Path
+from threading import Event, Thread
+from time import sleep, time
+
+from .blobs import BlobStore
+from .index import CacheIndex
+
+logger = getLogger(__name__)
+
+
+def remove_entry(index: CacheIndex, path: Path, blob_store: BlobStore | None = None):
+    """
+    Removes the entry directory and forgets it, with the blobs only it used if
+    given the `blob_store`. Returns the freed bytes of those blobs.
+    """
+    freed = 0
+    if blob_store is not None:
+        freed = blob_store.remove(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+    index.remove(path)
+    return freed
+
+
+def remove_unused(
+    index: CacheIndex, used_before: float, blob_store: BlobStore | None = None
+):
+    "Removes every entry not used since `used_before`, returns the freed bytes."
+    freed = 0
+    for path, size in index.least_recently_used(used_before):
+        logger.info(f"Removing {path} ({size} bytes)")
+        freed += size + remove_entry(index, path, blob_store)
+    return freed
+
+
+class CacheEvictor:
+    """
+    Removes the least recently used entries of the index when their size exceeds
+    `budget` bytes. Runs every `interval` seconds in a background thread, or sooner
+    when an entry of the index grows, but at most once every `min_interval`
+    seconds. Entries used in the last `grace` seconds are kept.
+    """
+
+    def __init__(
+        self,
+        index: CacheIndex,
+        budget: int,
+        *,
+        blob_store: BlobStore | None = None,
+        interval: float = 60,
+        min_interval: float = 1,
+        grace: float = 600,
+    ):
+        self._index = index
+        self._budget = budget
+        self._blob_store = blob_store
+        self._interval = interval
+        self._min_interval = min_interval
+        self._grace = grace
+        self._wake_up = Event()
+        self._thread = Thread(target=self._loop, daemon=True, name="cache-evictor")
+
+    def start(self):
+        self._index.on_growth(self.notify)
+        self._thread.start()
+        return self
+
+    def notify(self):
+        "Wakes up the evictor, called when an entry of the index grows."
+        self._wake_up.set()
+
+    def evict(self) -> int:
+        "Removes entries until the cache fits the budget, returns the freed bytes."
+        excess = self._index.total_size() - self._budget
+        if excess <= 0:
+            return 0
+
+        freed = 0
+        for path, size in self._index.least_recently_used(time() - self._grace):
+            if freed >= excess:
+                break
+            logger.info(f"Evicting {path} ({size} bytes)")
+            freed += size + remove_entry(self._index, path, self._blob_store)
+
+        if freed < excess:
+            logger.warning(f"Cache {self._index.root} is over its budget by recent use")
+        return freed
+
+    def _loop(self):
+        while True:
+            self._wake_up.wait(self._interval)
+            self._wake_up.clear()
+            try:
+                self.evict()
+            except Exception:
+                logger.exception(f"Failed to evict entries of {self._index.root}")
+            sleep(self._min_interval)
@@ -0,0 +1,177 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import monotonic, time, time_ns
+
+from ..utils.hash import file_digest
+
+logger = getLogger(__name__)
+
+HASH_INDEX_FILE = ".file-hashes.sqlite3"
+
+# written by previous versions, with every entry in one JSON object
+LEGACY_HASH_INDEX_FILE = ".file-hashes.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+# files modified this recently may change again without changing their mtime
+RACY_WINDOW_NS = 2_000_000_000
+
+PRUNE_INTERVAL = 24 * 60 * 60
+
+
+class FileHashIndex:
+    """
+    Persistent memo of file SHA-256 digests, keyed by (device, inode) and validated
+    with the size and `mtime_ns` of the file, so unchanged files are not read again.
+    Stored in SQLite: new digests are kept in memory and written as rows by `save`,
+    and `prune` forgets the files that no longer exist or changed, which is done
+    when the index is opened, at most every `PRUNE_INTERVAL` seconds.
+    Use `for_path` to load each index once per process.
+    """
+
+    _instances: dict[Path, "FileHashIndex"] = {}
+    _instances_lock = Lock()
+
+    @classmethod
+    def for_path(cls, path: Path) -> "FileHashIndex":
+        path = path.resolve()
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def __init__(self, path: Path, *, save_interval: float = 5) -> None:
+        self._path = path
+        self._save_interval = save_interval
+        # `_lock` guards the pending entries, `_db_lock` the connection
+        self._lock = Lock()
+        self._db_lock = Lock()
+        self._pending: dict[str, tuple[str, int, int, bytes]] = {}
+        self._last_save = monotonic()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.with_name(LEGACY_HASH_INDEX_FILE).unlink(missing_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db_lock, self._connection as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            row = connection.execute(
+                "SELECT value FROM meta WHERE name = 'pruned'"
+            ).fetchone()
+        if row is None or time() - row[0] > PRUNE_INTERVAL:
+            self.prune()
+        atexit.register(self.save)
+
+    def digest(self, path: Path) -> bytes:
+        "Returns the SHA-256 digest of the file, reading it only if it changed."
+        stat = path.stat()
+        key = f"{stat.st_dev}:{stat.st_ino}"
+        entry = self._get(key)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            return entry[2]
+
+        with path.open("rb") as file:
+            digest = file_digest(file, hashlib.sha256).digest()
+
+        if time_ns() - stat.st_mtime_ns > RACY_WINDOW_NS:
+            with self._lock:
+                self._pending[key] = (
+                    os.path.abspath(path),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    digest,
+                )
+
+        return digest
+
+    def remember(self, path: Path, size: int, mtime_ns: int, digest: bytes):
+        "Records a digest computed elsewhere, if the file did not change since."
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            return
+        if time_ns() - stat.st_mtime_ns <= RACY_WINDOW_NS:
+            return
+
+        key = f"{stat.st_dev}:{stat.st_ino}"
+        if self._get(key) != (size, mtime_ns, digest):
+            with self._lock:
+                self._pending[key] = (os.path.abspath(path), size, mtime_ns, digest)
+
+    def save_if_needed(self):
+        "Saves the new digests if there are any and were not saved in the last seconds."
+        if self._pending and monotonic() - self._last_save > self._save_interval:
+            self.save()
+
+    def save(self):
+        "Writes the new digests, one row each."
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_save = monotonic()
+        if not pending:
+            return
+
+        try:
+            with self._db_lock, self._connection as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO hashes (key, path, size, mtime_ns, digest)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [(key, *entry) for key, entry in pending.items()],
+                )
+        except sqlite3.Error as error:
+            logger.warning(f"Failed to save the file hash index {self._path}: {error}")
+
+    def prune(self):
+        "Forgets the digests of files that no longer exist or changed since."
+        with self._db_lock:
+            rows = self._connection.execute(
+                "SELECT key, path, size, mtime_ns FROM hashes"
+            ).fetchall()
+
+        stale = [(key,) for key, *entry in rows if not _is_current(key, *entry)]
+        with self._db_lock, self._connection as connection:
+            connection.executemany("DELETE FROM hashes WHERE key = ?", stale)
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('pruned', ?)",
+                (time(),),
+            )
+        logger.info(f"Pruned {len(stale)} of {len(rows)} file hashes of {self._path}")
+
+    def _get(self, key: str) -> tuple[int, int, bytes] | None:
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            return pending[1:]
+        with self._db_lock:
+            return self._connection.execute(
+                "SELECT size, mtime_ns, digest FROM hashes WHERE key = ?", (key,)
+            ).fetchone()
+
+
+def _is_current(key: str, path: str, size: int, mtime_ns: int):
+    "If the file at `path` is still the one of the entry, unchanged."
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return False
+    current = (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns)
+    return current and f"{stat.st_dev}:{stat.st_ino}" == key
@@ -0,0 +1,197 @@
+import os
+import sqlite3
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Callable
+
+from ..utils.dir import dir_size
+
+logger = getLogger(__name__)
+
+INDEX_FILE = ".cache-index.sqlite3"
+
+SCHEMA_VERSION = 1
+
+# `scopes` keeps running totals of `entries`, grouped by the parent directory of
+# each entry (like `assignment/user`), so totals never require a full scan.
+SCHEMA = """
+DROP TABLE IF EXISTS entries;
+DROP TABLE IF EXISTS scopes;
+CREATE TABLE entries (
+    path TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX entries_last_used ON entries (last_used);
+CREATE TABLE scopes (
+    scope TEXT PRIMARY KEY,
+    size INTEGER NOT NULL DEFAULT 0,
+    entries INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO scopes (scope, size, entries) VALUES (new.scope, new.size, 1)
+    ON CONFLICT (scope) DO UPDATE SET
+        size = size + excluded.size, entries = entries + 1;
+END;
+CREATE TRIGGER entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE scopes SET size = size - old.size + new.size WHERE scope = new.scope;
+END;
+CREATE TRIGGER entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE scopes SET size = size - old.size, entries = entries - 1
+    WHERE scope = old.scope;
+END;
+"""
+
+
+class CacheIndex:
+    """
+    SQLite index of the entries of a cache root (stage or repository directories),
+    with their size and last use, so the cache can be managed without walking it.
+    Entries are stored as paths relative to the root, and their sizes are added up
+    by scope (the parent directory of the entry) as they change.
+    Functions added with `on_growth` are called after an entry grows.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root.resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._growth_listeners: list[Callable[[], None]] = []
+        self._connection = sqlite3.connect(
+            self.root / INDEX_FILE, timeout=30, check_same_thread=False
+        )
+        with self._lock, self._connection as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                # only metadata, `reconcile` rebuilds it from the directories
+                connection.executescript(SCHEMA)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def on_growth(self, listener: Callable[[], None]):
+        "Calls `listener` after the size of an entry is set or grows."
+        self._growth_listeners.append(listener)
+
+    def touch(self, entry: Path, size: int | None = None):
+        "Marks the entry as used now, updating its size if given."
+        path, scope = self._key(entry)
+        with self._lock, self._connection as connection:
+            connection.execute(
+                "INSERT INTO entries (path, scope, size, last_used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (path) DO UPDATE SET last_used = excluded.last_used,"
+                " size = coalesce(?, size)",
+                (path, scope, size or 0, time(), size),
+            )
+        if size:
+            self._grew()
+
+    def set_size(self, entry: Path, size: int):
+        "Sets the size of the entry, without marking it as used."
+        path, scope = self._key(entry)
+        with self._lock, self._connection as connection:
+            connection.execute(
+                "INSERT INTO entries (path, scope, size, last_used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (path) DO UPDATE SET size = excluded.size",
+                (path, scope, size, time()),
+            )
+        if size:
+            self._grew()
+
+    def grow(self, entry: Path, delta: int):
+        "Adds `delta` bytes to the size of the entry."
+        path, scope = self._key(entry)
+        with self._lock, self._connection as connection:
+            connection.execute(
+                "INSERT INTO entries (path, scope, size, last_used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (path) DO UPDATE SET size = size + excluded.size",
+                (path, scope, delta, time()),
+            )
+        if delta > 0:
+            self._grew()
+
+    def remove(self, entry: Path):
+        path, _ = self._key(entry)
+        with self._lock, self._connection as connection:
+            connection.execute("DELETE FROM entries WHERE path = ?", (path,))
+
+    def total_size(self) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT coalesce(sum(size), 0) FROM scopes"
+            )
+            return cursor.fetchone()[0]
+
+    def usage_by_scope(self) -> list[tuple[str, int, int]]:
+        "Returns the scope, size and number of entries of every non-empty scope."
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT scope, size, entries FROM scopes WHERE entries > 0"
+                " ORDER BY size DESC"
+            )
+            return cursor.fetchall()
+
+    def least_recently_used(self, used_before: float) -> list[tuple[Path, int]]:
+        "Returns the entries not used since `used_before`, the oldest first."
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT path, size FROM entries WHERE last_used < ?"
+                " AND path NOT LIKE '.%' ORDER BY last_used",
+                (used_before,),
+            )
+            return [(self.root / path, size) for path, size in cursor.fetchall()]
+
+    def forget_missing(self):
+        "Removes the entries whose directory no longer exists."
+        for path in self._paths():
+            if not (self.root / path).exists():
+                self.remove(self.root / path)
+
+    def reconcile(
+        self,
+        is_entry: Callable[[Path], bool],
+        max_depth: int,
+        size: Callable[[Path], int] = dir_size,
+    ):
+        """
+        Scans the root for entries, down to `max_depth` directories, measuring the
+        `size` of each one. Fixes sizes that drifted and forgets missing entries.
+        Hidden directories are skipped, so their entries are forgotten.
+        """
+        started = time()
+        found: set[str] = set()
+        pending = [(self.root, 0)]
+        while pending:
+            dir, depth = pending.pop()
+            if is_entry(dir):
+                found.add(self._key(dir)[0])
+                self.set_size(dir, size(dir))
+            elif depth < max_depth:
+                pending += [
+                    (Path(e.path), depth + 1)
+                    for e in os.scandir(dir)
+                    if e.is_dir(follow_symlinks=False) and not e.name.startswith(".")
+                ]
+
+        for path in self._paths(used_before=started):
+            if path not in found:
+                self.remove(self.root / path)
+        logger.info(f"Reconciled {len(found)} entries of {self.root}")
+
+    def _paths(self, used_before: float | None = None) -> list[str]:
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT path FROM entries WHERE last_used < ?",
+                (time() if used_before is None else used_before,),
+            )
+            return [path for path, in cursor.fetchall()]
+
+    def _grew(self):
+        for listener in self._growth_listeners:
+            listener()
+
+    def _key(self, entry: Path):
+        path = entry.resolve().relative_to(self.root)
+        return path.as_posix(), path.parent.as_posix()
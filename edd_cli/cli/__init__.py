@@ -5,8 +5,10 @@ from . import commands, config_logging
 app = Typer(name="edd")
 app.command()(commands.run)
 app.command()(commands.server)
+app.command(name="download")(commands.download_repositories)
 app.command(name="run-cloned")(commands.run_cloned_folders)
 app.command(name="list")(commands.list_test_groups)
+app.command(name="compile-suite")(commands.compile_test_suite)
 app.callback()(config_logging.set_logging_level)
 
 __all__ = ["app"]
@@ -1,27 +1,23 @@
+import os
+from functools import cache
 from logging import getLogger
 from pathlib import Path
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
-import pydantic_core
-from rich.console import Console
-from rich.progress import track
-from rich.table import Table
 from typer import Option
 
-from ..finder import get_tests_groups
-from ..runner import (
-    AbstractRunner,
-    DirectRunner,
-    DockerRunner,
-    Orchestrator,
-    TempDirGenerator,
-)
+from ..repository import FetchMode
+from ..runner import RunnerKind
+
+if TYPE_CHECKING:
+    from ..runner import AbstractRunner, TempDirGenerator
+
+# Commands import what they use when they run, so every command starts fast.
+# `benchmarks/cli_startup.py` checks the import time of this module.
 
 default_repo_dir = Path.cwd()
 default_test_dir = Path("tests")
 
-runner = DockerRunner()
-
 logger = getLogger(__name__)
 
 
@@ -31,18 +27,49 @@ def server():
 
 Dir = Annotated[Path, Option(exists=True, dir_okay=True, file_okay=False)]
 
-dir_generator = TempDirGenerator(base_path=Path(".edd-cache"))
+
+@cache
+def get_dir_generator() -> "TempDirGenerator":
+    "The stage cache of the current directory, created by the first command using it."
+    from ..runner import TempDirGenerator
+
+    return TempDirGenerator(base_path=Path(".edd-cache"))
 
 
 def run(
     test_dir: Dir = default_test_dir,
     repo_dir: Dir = default_repo_dir,
     clean_run: bool = Option(False, "-c", "--clean-run"),
+    jobs: int = Option(1, "-j", "--jobs", min=1, help="Test cases run at once"),
+    runner_kind: RunnerKind = Option("docker", "-r", "--runner"),
+    link_include: bool = Option(
+        False,
+        "--link-include",
+        help="Hardlink test files instead of copying them, with docker-pool",
+    ),
 ):
+    from rich.console import Console
+    from rich.progress import track
+    from rich.table import Table
+
+    from ..finder import load_suite
+    from ..runner import Orchestrator, create_runner
+
     console = Console()
+    runner = create_runner(runner_kind)
+    if link_include and not runner.protects_stage_files:
+        console.print(
+            f"The {runner_kind.value} runner can modify linked files, copying them",
+            style="yellow",
+        )
+        link_include = False
+    dir_generator = get_dir_generator()
     dir_generator.cache = not clean_run
-    test_groups = get_tests_groups(test_dir)
-    orchestrator = Orchestrator(repo_dir, runner, dir_generator)
+    dir_generator.link_include = link_include
+    test_groups, manifest = load_suite(test_dir)
+    if manifest is not None:
+        dir_generator.remember_digests(manifest.digests(test_dir))
+    orchestrator = Orchestrator(repo_dir, runner, dir_generator, jobs=jobs)
 
     for g in orchestrator.iter_run_assignment_group(test_groups):
         if g.result.verdict == "error":
@@ -54,18 +81,35 @@ def run(
         table.add_column("Verdict")
         table.add_column("Error")
         table.add_column("Time")
+        table.add_column("CPU time")
+        table.add_column("Memory")
         table.add_column("Score")
 
         desc = f"Running tests for {g.name}"
         for t in track(g.iter_run_group_test(), description=desc, total=len(g.tests)):
             if t.verdict == "error":
-                table.add_row(t.name, "[red]Error", t.error, "", "")
+                table.add_row(t.name, "[red]Error", t.error, "", "", "", "")
             else:
-                table.add_row(t.name, "[green]Ok", "", str(t.time), str(t.percentage))
+                cpu_time = "" if t.cpu_time is None else str(t.cpu_time)
+                memory = "" if t.max_rss is None else f"{t.max_rss} KiB"
+                table.add_row(
+                    t.name,
+                    "[green]Ok",
+                    "",
+                    str(t.time),
+                    cpu_time,
+                    memory,
+                    str(t.percentage),
+                )
         console.print(table)
 
 
 def list_test_groups(test_dir: Dir = default_test_dir):
+    from rich.console import Console
+    from rich.table import Table
+
+    from ..finder import get_tests_groups
+
     test_groups = get_tests_groups(test_dir)
     console = Console()
     for group in test_groups:
@@ -77,19 +121,162 @@ def list_test_groups(test_dir: Dir = default_test_dir):
         console.print(table)
 
 
+def compile_test_suite(
+    test_dir: Dir = default_test_dir,
+    all_assignments: bool = Option(
+        False, "--all", help="Compile each assignment in test_dir, like the server"
+    ),
+):
+    """
+    Writes a manifest with the parsed test suite, to load large suites faster.
+    The server compiles it again when the suite changes, other commands ignore a
+    stale manifest.
+    """
+    from rich.console import Console
+
+    from ..finder import compile_suite
+
+    console = Console()
+    suites = (
+        sorted(dir for dir in test_dir.iterdir() if dir.is_dir())
+        if all_assignments
+        else [test_dir]
+    )
+    for suite in suites:
+        manifest = compile_suite(suite)
+        tests = sum(len(group.tests) for group in manifest.groups)
+        console.print(
+            f"Compiled {suite}: {len(manifest.groups)} groups, {tests} tests, "
+            f"{len(manifest.files)} files"
+        )
+
+
+def download_repositories(
+    prefix: str,
+    org: str = Option(..., envvar="GITHUB_ORG"),
+    repos_dir: Path = Path("repos"),
+    remote: str = Option(
+        None, help="Git URL with {org} and {repo} to clone from, instead of gh"
+    ),
+    fetch: FetchMode = Option("full"),
+    jobs: int = Option(
+        4, "-j", "--jobs", min=1, help="Repositories downloaded at once"
+    ),
+):
+    """
+    Clones or updates every repository of the organization starting with `prefix`
+    (like `T2-2022-2-`) in `repos_dir/org`, to grade them with `run-cloned`.
+    """
+    from rich.console import Console
+
+    from ..repository import RepositoryDownloader, RepositoryDownloadException
+
+    console = Console()
+    downloader = RepositoryDownloader(org, repos_dir, remote=remote, fetch=fetch)
+    try:
+        repos = downloader.list_repositories(prefix)
+    except RepositoryDownloadException as error:
+        console.print(str(error), style="red")
+        raise SystemExit(1)
+
+    results = downloader.download_many(repos, max_workers=jobs)
+    failed = [repo for repo, path in results.items() if not isinstance(path, Path)]
+    for repo in failed:
+        console.print(f"Failed to download {repo}: {results[repo]}", style="red")
+    console.print(
+        f"Downloaded {len(repos) - len(failed)} of {len(repos)} repositories"
+        f" to {repos_dir / org}"
+    )
+
+
 def run_cloned_folders(
-    output_file: Path, repos_dir: Dir = Path("repos"), test_dir: Dir = default_test_dir
+    output_file: Path,
+    repos_dir: Dir = Path("repos"),
+    test_dir: Dir = default_test_dir,
+    jobs: int = Option(
+        1, "-j", "--jobs", min=0, help="Repositories graded at once, 0 for auto"
+    ),
+    job_memory: int = Option(512, help="Expected memory (MB) used by each job"),
 ):
+    import pydantic_core
+    from rich.progress import Progress
+
+    from ..runner import DirectRunner
+
     runner = DirectRunner()
     repos = [repo for repo in repos_dir.iterdir() if repo.is_dir()]
-    with output_file.open("wb") as output:
-        for repo in track(repos):
-            result = run_cloned_folder(repo, test_dir, runner)
-            json = pydantic_core.to_json(result)
-            output.write(json)
+    workers = _max_workers(jobs, job_memory)
+    logger.info(f"Grading {len(repos)} repositories with {workers} workers")
+
+    with output_file.open("wb") as output, Progress() as progress:
+        task = progress.add_task("Grading repositories", total=len(repos))
+        for result in _iter_run_cloned_folders(repos, test_dir, runner, workers):
+            output.write(pydantic_core.to_json(result))
             output.write(b"\n")
+            output.flush()
+            progress.advance(task)
+
+
+def _max_workers(jobs: int, job_memory: int):
+    "Limits the workers by the available cores and memory, `jobs=0` uses all cores."
+    cpus = os.cpu_count() or 1
+    workers = cpus if jobs == 0 else min(jobs, cpus)
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        workers = min(workers, available // (job_memory * 1024 * 1024))
+    except (ValueError, OSError):
+        logger.debug("Can't read the available memory, limiting only by cores")
+    return max(workers, 1)
+
+
+def _iter_run_cloned_folders(
+    repos: list[Path], test_dir: Path, runner: "AbstractRunner", workers: int
+):
+    """
+    Yields the results of each repository as soon as it finishes. Repositories
+    that failed to be graded are yielded with an error result.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if workers == 1:
+        for repo in repos:
+            try:
+                yield run_cloned_folder(repo, test_dir, runner)
+            except Exception as error:
+                yield _grading_error(repo, test_dir, error)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_cloned_folder, repo, test_dir, runner): repo
+            for repo in repos
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as error:
+                yield _grading_error(futures[future], test_dir, error)
+
+
+def _grading_error(repo_dir: Path, test_dir: Path, error: Exception):
+    from ..schema.results import AssignmentResults, TestGroupErrorResults
+
+    logger.error(f"Failed to grade {repo_dir}: {error!r}")
+    return AssignmentResults(
+        name=test_dir.resolve().name,
+        user=repo_dir.name,
+        results=[TestGroupErrorResults(name="grading", error=repr(error))],
+    )
+
 
+def run_cloned_folder(repo_dir: Path, test_dir: Path, runner: "AbstractRunner"):
+    from ..finder import get_tests_groups
+    from ..runner import Orchestrator
+    from ..schema.results import AssignmentResults
 
-def run_cloned_folder(repo_dir: Path, test_dir: Path, runner: AbstractRunner):
     assignment_groups = get_tests_groups(test_dir)
-    return Orchestrator(repo_dir, runner, dir_generator).run(assignment_groups)
+    dir_generator = get_dir_generator()
+    results = Orchestrator(repo_dir, runner, dir_generator).run(assignment_groups)
+    return AssignmentResults(
+        name=test_dir.resolve().name, user=repo_dir.name, results=results
+    )
@@ -1,6 +1,5 @@
 import logging
 
-from rich.logging import RichHandler
 from typer import Option
 
 
@@ -26,6 +25,8 @@ def set_logging_level(
         os.environ["TERM"] = "dumb"
         logging.basicConfig(level=logging_level)
     else:
+        from rich.logging import RichHandler
+
         logging.basicConfig(
             level=logging_level, handlers=[RichHandler(rich_tracebacks=True)]
         )
@@ -1,3 +1,19 @@
-from .finder import TestCaseFinder, get_tests_groups
+from .finder import (
+    IndexedAssignment,
+    TestCaseFinder,
+    compile_suite,
+    get_tests_groups,
+    load_suite,
+)
+from .manifest import MANIFEST_FILE, SuiteManifest, is_manifest_file
 
-__all__ = ["TestCaseFinder", "get_tests_groups"]
+__all__ = [
+    "IndexedAssignment",
+    "MANIFEST_FILE",
+    "SuiteManifest",
+    "TestCaseFinder",
+    "compile_suite",
+    "get_tests_groups",
+    "is_manifest_file",
+    "load_suite",
+]
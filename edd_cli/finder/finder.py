@@ -1,10 +1,23 @@
+import os
+from dataclasses import dataclass, replace
+from datetime import datetime
 from logging import getLogger
 from pathlib import Path
+from threading import Lock
+from time import monotonic
 
 from pydantic import ValidationError
 
 from ..schema.tests import Assignment, TestCase, TestGroup
-from ..utils.dir import dir_last_use
+from ..utils.dir import dir_files, dir_signature, files_signature
+from .manifest import (
+    MANIFEST_FILE,
+    SuiteManifest,
+    build_manifest,
+    is_manifest_file,
+    read_manifest,
+    write_manifest,
+)
 
 logger = getLogger(__name__)
 
@@ -38,8 +51,8 @@ def get_test_cases_configs(group_dir: Path):
             )
 
 
-def get_tests_groups(test_dir: Path):
-    "Finds every test group with every test case in the given `test_dir`."
+def parse_tests_groups(test_dir: Path):
+    "Parses every test group with every test case in the given `test_dir`."
     test_groups: list[TestGroup] = []
     for group_dir, group_config in get_test_cases_groups_configs(test_dir):
         for test_dir, test_config in get_test_cases_configs(group_dir):
@@ -53,9 +66,93 @@ def get_tests_groups(test_dir: Path):
     return test_groups
 
 
+def compile_suite(
+    test_dir: Path,
+    previous: SuiteManifest | None = None,
+    files: list[tuple[str, os.stat_result]] | None = None,
+):
+    """
+    Parses the suite in `test_dir` and writes its manifest. The `files` of the
+    suite (from `dir_files`) are listed if not given.
+    """
+    if files is None:
+        files = dir_files(test_dir, exclude=is_manifest_file)
+    fingerprint, _ = files_signature(files)
+    groups = parse_tests_groups(test_dir)
+    manifest = build_manifest(test_dir, groups, files, fingerprint, previous)
+    write_manifest(test_dir, manifest)
+    return manifest
+
+
+def load_suite(
+    test_dir: Path, fingerprint: str | None = None, *, update: bool = False
+) -> tuple[list[TestGroup], SuiteManifest | None]:
+    """
+    Loads the test groups from the manifest of the suite, or parses them if the
+    suite was never compiled. A stale manifest is compiled again with `update`,
+    otherwise it is ignored, so only `compile_suite` writes to the suite.
+    Without the `fingerprint` of the suite, every file is checked (with `stat`)
+    against the manifest, which takes longer than parsing suites with many data
+    files, so the manifest pays off when the `fingerprint` is already known.
+    """
+    if not (test_dir / MANIFEST_FILE).is_file():
+        return parse_tests_groups(test_dir), None
+
+    manifest = read_manifest(test_dir)
+    files = None
+    if manifest is None:
+        stale = True
+    elif fingerprint is None:
+        files = dir_files(test_dir, exclude=is_manifest_file)
+        stale = not manifest.matches(files)
+    else:
+        stale = manifest.fingerprint != fingerprint
+
+    if stale and not update:
+        logger.warning(
+            f"Manifest of {test_dir} is stale, parsing the suite."
+            " Run `edd compile-suite` to compile it again"
+        )
+        return parse_tests_groups(test_dir), None
+    if stale:
+        logger.info(f"Manifest of {test_dir} is stale, compiling it again")
+        try:
+            manifest = compile_suite(test_dir, previous=manifest, files=files)
+        except OSError as error:
+            logger.warning(f"Can't write the manifest of {test_dir}: {error}")
+            return parse_tests_groups(test_dir), None
+
+    return manifest.test_groups(test_dir), manifest
+
+
+def get_tests_groups(test_dir: Path):
+    "Finds every test group with every test case in the given `test_dir`."
+    return load_suite(test_dir)[0]
+
+
+@dataclass(frozen=True)
+class IndexedAssignment:
+    "Parsed test suite of an assignment, with the signature of its files."
+
+    path: Path
+    fingerprint: str
+    updated_at: datetime
+    groups: tuple[TestGroup, ...]
+    manifest: SuiteManifest | None = None
+
+
 class TestCaseFinder:
-    def __init__(self, assignments_dir: Path):
+    """
+    Finds the test suites of every assignment, keeping them parsed in memory.
+    A suite is checked for changes (a walk with `stat`, without reading files) at
+    most every `refresh_interval` seconds, and parsed again only if it changed.
+    """
+
+    def __init__(self, assignments_dir: Path, *, refresh_interval: float = 2):
         self.assignments_dir = assignments_dir
+        self._refresh_interval = refresh_interval
+        self._lock = Lock()
+        self._index: dict[str, tuple[IndexedAssignment, float]] = {}
 
     def list_assignments(self):
         if not self.assignments_dir.is_dir():
@@ -68,13 +165,11 @@ class TestCaseFinder:
             if not dir.is_dir():
                 continue
 
-            groups = get_tests_groups(dir)
-
-            if len(groups) == 0:
-                logger.warning(f"Skipping assignment {dir} with no groups")
+            indexed = self.get_indexed_assignment(dir.name)
+            if indexed is None or len(indexed.groups) == 0:
                 continue
 
-            assignment = Assignment(name=dir.name, updated_at=dir_last_use(dir))
+            assignment = Assignment(name=dir.name, updated_at=indexed.updated_at)
             assignments.append(assignment)
 
         return assignments
@@ -86,13 +181,48 @@ class TestCaseFinder:
 
         return assignment_path
 
-    def get_assignment(self, assignment_name: str):
+    def get_indexed_assignment(self, assignment_name: str):
+        "Returns the suite of the assignment, parsing it only if it changed."
         assignment_path = self.get_assignment_path(assignment_name)
         if not assignment_path:
+            with self._lock:
+                self._index.pop(assignment_name, None)
+            return None
+
+        with self._lock:
+            indexed, checked_at = self._index.get(assignment_name, (None, 0.0))
+        if indexed is not None and monotonic() - checked_at < self._refresh_interval:
+            return indexed
+
+        checked_at = monotonic()
+        fingerprint, updated_at = dir_signature(
+            assignment_path, exclude=is_manifest_file
+        )
+        if indexed is not None and indexed.fingerprint == fingerprint:
+            indexed = replace(indexed, updated_at=updated_at)
+        else:
+            groups, manifest = load_suite(assignment_path, fingerprint, update=True)
+            if len(groups) == 0:
+                logger.warning(f"Assignment {assignment_path} has no groups")
+            indexed = IndexedAssignment(
+                assignment_path, fingerprint, updated_at, tuple(groups), manifest
+            )
+
+        with self._lock:
+            self._index[assignment_name] = (indexed, checked_at)
+        return indexed
+
+    def get_assignment(self, assignment_name: str):
+        indexed = self.get_indexed_assignment(assignment_name)
+        if indexed is None or len(indexed.groups) == 0:
             return None
 
-        groups = get_tests_groups(assignment_path)
-        if len(groups) == 0:
+        return list(indexed.groups)
+
+    def get_assignment_fingerprint(self, assignment_name: str):
+        "Returns a hash that changes when any file of the test suite changes."
+        indexed = self.get_indexed_assignment(assignment_name)
+        if indexed is None:
             return None
 
-        return groups
+        return indexed.fingerprint
@@ -0,0 +1,180 @@
+import hashlib
+import os
+from logging import getLogger
+from pathlib import Path
+from threading import get_ident
+
+from pydantic import BaseModel, ValidationError
+
+from ..schema.tests import AbstractPipeline, TestCase, TestGroup
+from ..utils.hash import file_digest
+
+logger = getLogger(__name__)
+
+MANIFEST_FILE = ".edd-manifest.json"
+
+MANIFEST_VERSION = 1
+
+
+def is_manifest_file(path: str):
+    "If the relative path is the manifest, or a temporary file written to replace it."
+    return path.startswith(MANIFEST_FILE)
+
+
+class SuiteFile(BaseModel):
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+class CompiledTestCase(BaseModel):
+    path: str
+    test: TestCase
+
+
+class CompiledTestGroup(BaseModel):
+    path: str
+    group: TestGroup
+    tests: list[CompiledTestCase]
+
+
+class SuiteManifest(BaseModel):
+    """
+    Precompiled test suite of an assignment, stored in `MANIFEST_FILE` at its root.
+    Has the validated pipelines, with the globs of `include` already expanded, and
+    the size, modification time and SHA-256 of every file of the suite. It is stale
+    when the `fingerprint` of the suite files (`dir_signature`) changes.
+    Paths are relative to the suite directory.
+    """
+
+    version: int = MANIFEST_VERSION
+    fingerprint: str
+    groups: list[CompiledTestGroup]
+    files: list[SuiteFile]
+
+    def test_groups(self, suite_dir: Path) -> list[TestGroup]:
+        "Returns new test groups in `suite_dir`, sharing the validated steps."
+        test_groups: list[TestGroup] = []
+        for compiled in self.groups:
+            # constructed, as a copy would share the tests of the group
+            group = TestGroup.model_construct(
+                name=compiled.group.name, steps=compiled.group.steps
+            )
+            group.set_dir_path(suite_dir / compiled.path)
+            for compiled_test in compiled.tests:
+                test = compiled_test.test.model_copy()
+                test.set_dir_path(suite_dir / compiled_test.path)
+                group.add_test(test)
+            test_groups.append(group)
+        return test_groups
+
+    def matches(self, files: list[tuple[str, os.stat_result]]):
+        "If the `files` of the suite (from `dir_files`) did not change since compiled."
+        return len(files) == len(self.files) and all(
+            file.path == path
+            and file.size == stat.st_size
+            and file.mtime_ns == stat.st_mtime_ns
+            for file, (path, stat) in zip(self.files, files)
+        )
+
+    def digests(self, suite_dir: Path):
+        "Yields the path, size, modification time and digest of every file."
+        root = suite_dir.resolve()
+        for file in self.files:
+            yield root / file.path, file.size, file.mtime_ns, bytes.fromhex(file.sha256)
+
+
+def build_manifest(
+    suite_dir: Path,
+    groups: list[TestGroup],
+    files: list[tuple[str, os.stat_result]],
+    fingerprint: str,
+    previous: SuiteManifest | None = None,
+):
+    """
+    Compiles the parsed `groups` of the suite with its `files` (from `dir_files`).
+    Only files that changed since the `previous` manifest are hashed again.
+    """
+    known = {
+        (file.path, file.size, file.mtime_ns): file.sha256
+        for file in (previous.files if previous is not None else [])
+    }
+    suite_files: list[SuiteFile] = []
+    for path, stat in files:
+        sha256 = known.get((path, stat.st_size, stat.st_mtime_ns))
+        if sha256 is None:
+            with (suite_dir / path).open("rb") as file:
+                sha256 = file_digest(file, hashlib.sha256).hexdigest()
+        suite_files.append(
+            SuiteFile(
+                path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256
+            )
+        )
+
+    compiled_groups = [
+        CompiledTestGroup(
+            path=_relative(group.path, suite_dir),
+            group=_expand_includes(group),
+            tests=[
+                CompiledTestCase(
+                    path=_relative(test.path, suite_dir), test=_expand_includes(test)
+                )
+                for test in group.tests
+            ],
+        )
+        for group in groups
+    ]
+    return SuiteManifest(
+        fingerprint=fingerprint, groups=compiled_groups, files=suite_files
+    )
+
+
+def read_manifest(suite_dir: Path) -> SuiteManifest | None:
+    "Reads the manifest of the suite, `None` if missing, invalid or outdated."
+    try:
+        manifest = SuiteManifest.model_validate_json(
+            (suite_dir / MANIFEST_FILE).read_bytes()
+        )
+    except FileNotFoundError:
+        return None
+    except (OSError, ValidationError) as error:
+        logger.warning(f"Ignoring invalid manifest of {suite_dir}: {error}")
+        return None
+    if manifest.version != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(suite_dir: Path, manifest: SuiteManifest):
+    """
+    Writes the manifest atomically, through a temporary file in the suite that
+    `is_manifest_file` excludes from its files.
+    """
+    temp_path = suite_dir / f"{MANIFEST_FILE}.{os.getpid()}-{get_ident()}.tmp"
+    try:
+        temp_path.write_text(manifest.model_dump_json())
+        os.replace(temp_path, suite_dir / MANIFEST_FILE)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def _expand_includes(pipeline: AbstractPipeline):
+    "Returns the pipeline with the globs of `include` replaced by the matched paths."
+    steps = []
+    for step in pipeline.steps:
+        include: list = []
+        for path in step.include:
+            if isinstance(path, str) and "*" in path:
+                include += [
+                    match.relative_to(pipeline.path.resolve()).as_posix()
+                    for match in pipeline.path.resolve().glob(path)
+                ]
+            else:
+                include.append(path)
+        steps.append(step.model_copy(update={"include": include}))
+    return pipeline.model_copy(update={"steps": steps})
+
+
+def _relative(path: Path, suite_dir: Path):
+    return path.resolve().relative_to(suite_dir.resolve()).as_posix()
@@ -1,51 +1,27 @@
-from logging import getLogger
-from pathlib import Path
-from subprocess import Popen
+from importlib import import_module
+from typing import TYPE_CHECKING
 
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from .interface import FetchMode, RepositoryDownloadException
 
-logger = getLogger(__name__)
+if TYPE_CHECKING:
+    from .downloader import REFERENCES_DIR, RepositoryDownloader
 
+# Imported when used, so commands that only need `FetchMode` start fast
+_LAZY_MODULES = {
+    "REFERENCES_DIR": ".downloader",
+    "RepositoryDownloader": ".downloader",
+}
 
-class RepositoryDownloadException(Exception):
-    pass
 
+def __getattr__(name: str):
+    if name not in _LAZY_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_LAZY_MODULES[name], __name__), name)
 
-class RepositoryDownloader:
-    def __init__(self, org: str, download_dir: Path):
-        self.org = org
-        self.download_dir = download_dir.resolve()
 
-    def download(self, repo: str, *, pull_if_exists: bool = True):
-        download_path = self.download_dir / self.org / repo
-        download_path.parent.mkdir(parents=True, exist_ok=True)
-
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}. "),
-            transient=True,
-        ) as progress:
-            if (download_path / ".git").exists():
-                if not pull_if_exists:
-                    logger.info(f"Repository {self.org}/{repo} already downloaded")
-                    return download_path
-
-                progress.add_task(f"Pulling repository {repo}")
-                process = Popen(["git", "pull", "-f"], cwd=download_path)
-            else:
-                progress.add_task(f"Cloning repository {repo}")
-                process = Popen(
-                    ["gh", "repo", "clone", f"{self.org}/{repo}", repo],
-                    cwd=download_path.parent,
-                )
-
-            return_code = process.wait()
-
-            if return_code != 0:
-                raise RepositoryDownloadException(
-                    f"Failed to download repository {repo}"
-                )
-
-        logger.info(f"Repository {self.org}/{repo} downloaded")
-
-        return download_path
+__all__ = [
+    "FetchMode",
+    "REFERENCES_DIR",
+    "RepositoryDownloadException",
+    "RepositoryDownloader",
+]
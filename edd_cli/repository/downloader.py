@@ -0,0 +1,282 @@
+import glob
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from subprocess import PIPE, run
+
+from ..cache import CacheIndex
+from ..utils.dir import dir_size
+from ..utils.lock import FileLock
+from ..utils.single_flight import SingleFlight
+from .interface import FetchMode, RepositoryDownloadException
+
+logger = getLogger(__name__)
+
+REFERENCES_DIR = ".references"
+
+# remotes that `gh` can list, and local ones that are listed from their directory
+GITHUB_REMOTE = re.compile(r"(https://|ssh://git@|git@)github\.com[/:]")
+LOCAL_REMOTE = re.compile(r"file://|/")
+
+
+class RepositoryDownloader:
+    """
+    Downloads repositories. Concurrent downloads of a repository share one fetch,
+    and downloads of a repository with other options wait for it, holding a lock
+    per clone, as git can't run twice in the same clone.
+    Repositories are cloned with `gh`, or from `remote`, a git URL with `{org}`
+    and `{repo}` placeholders (like `file:///srv/repos/{repo}.git`).
+    Repositories downloaded with the same `reference` (like the assignment) are
+    cloned with `--reference`, borrowing the objects of a bare repository seeded
+    from the first one, so the objects of their template are stored once.
+    """
+
+    def __init__(
+        self,
+        org: str,
+        download_dir: Path,
+        index: CacheIndex | None = None,
+        *,
+        remote: str | None = None,
+        fetch: FetchMode = FetchMode.full,
+    ):
+        self.org = org
+        self.download_dir = download_dir.resolve()
+        self._index = index
+        self._remote = remote
+        self._fetch = fetch
+        self._downloads: SingleFlight[Path] = SingleFlight()
+
+    def download(
+        self,
+        repo: str,
+        *,
+        pull_if_exists: bool = True,
+        sparse_paths: list[str] | None = None,
+        reference: str | None = None,
+    ) -> Path:
+        """
+        Clones or updates the repository. With `sparse_paths`, only the files that
+        match them (with gitignore patterns, relative to the root) are checked out.
+        """
+        sparse = None if sparse_paths is None else tuple(sparse_paths)
+        return self._downloads.run(
+            (repo, pull_if_exists, sparse, reference),
+            lambda: self._download(repo, pull_if_exists, sparse_paths, reference),
+        )
+
+    def download_many(
+        self,
+        repos: list[str],
+        *,
+        max_workers: int = 4,
+        pull_if_exists: bool = True,
+        sparse_paths: list[str] | None = None,
+        reference: str | None = None,
+    ) -> dict[str, Path | RepositoryDownloadException]:
+        """
+        Downloads the repositories, up to `max_workers` at the same time, returning
+        the path or the error of each one.
+        """
+        with ThreadPoolExecutor(max_workers, thread_name_prefix="download") as executor:
+            futures = {
+                repo: executor.submit(
+                    self.download,
+                    repo,
+                    pull_if_exists=pull_if_exists,
+                    sparse_paths=sparse_paths,
+                    reference=reference,
+                )
+                for repo in dict.fromkeys(repos)
+            }
+
+        results: dict[str, Path | RepositoryDownloadException] = {}
+        for repo, future in futures.items():
+            try:
+                results[repo] = future.result()
+            except RepositoryDownloadException as error:
+                results[repo] = error
+        return results
+
+    def list_repositories(self, prefix: str) -> list[str]:
+        """
+        Returns the name of every repository of the organization with the prefix.
+        Repositories are listed with `gh`, or from the directories of a local
+        `remote`. Other remotes can't be listed.
+        """
+        if self._remote is not None and not GITHUB_REMOTE.match(self._remote):
+            return sorted(
+                name for name in self._list_local_remote() if name.startswith(prefix)
+            )
+
+        process = run(
+            ["gh", "repo", "list", self.org, "--limit", "10000"]
+            + ["--json", "name", "--jq", ".[].name"],
+            stdout=PIPE,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise RepositoryDownloadException(f"Failed to list {self.org} repositories")
+        return sorted(
+            name for name in process.stdout.split() if name.startswith(prefix)
+        )
+
+    def _list_local_remote(self):
+        "Yields the repositories that match the `remote` template in its directory."
+        assert self._remote is not None
+        if not LOCAL_REMOTE.match(self._remote):
+            message = f"Can't list the repositories of {self._remote}"
+            raise RepositoryDownloadException(message)
+
+        template = self._remote.removeprefix("file://")
+        before, _, after = template.partition("{repo}")
+        before, after = before.format(org=self.org), after.format(org=self.org)
+        name = re.compile(re.escape(before) + "([^/]+)" + re.escape(after))
+        for path in glob.glob(glob.escape(before) + "*" + glob.escape(after)):
+            match = name.fullmatch(path)
+            if match is not None:
+                yield match.group(1)
+
+    def head_commit(self, repo_path: Path) -> str:
+        "Returns the hash of the checked out commit of a downloaded repository."
+        process = run(
+            ["git", "rev-parse", "HEAD"], cwd=repo_path, stdout=PIPE, text=True
+        )
+        if process.returncode != 0:
+            raise RepositoryDownloadException(f"Failed to read HEAD of {repo_path}")
+        return process.stdout.strip()
+
+    def _download(
+        self,
+        repo: str,
+        pull_if_exists: bool,
+        sparse_paths: list[str] | None,
+        reference: str | None,
+    ):
+        try:
+            return self._fetch_repository(repo, pull_if_exists, sparse_paths, reference)
+        except RepositoryDownloadException as error:
+            message = f"Failed to download repository {repo}"
+            raise RepositoryDownloadException(message) from error
+
+    def _fetch_repository(
+        self,
+        repo: str,
+        pull_if_exists: bool,
+        sparse_paths: list[str] | None,
+        reference: str | None,
+    ):
+        download_path = self.download_dir / self.org / repo
+        download_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # hidden, so the cache index does not take it for a repository
+        with FileLock(download_path.with_name(f".{repo}.lock")):
+            return self._fetch_locked(
+                repo, download_path, pull_if_exists, sparse_paths, reference
+            )
+
+    def _fetch_locked(
+        self,
+        repo: str,
+        download_path: Path,
+        pull_if_exists: bool,
+        sparse_paths: list[str] | None,
+        reference: str | None,
+    ):
+        # logged instead of a progress spinner, as downloads run concurrently
+        if (download_path / ".git").exists():
+            self._set_sparse_paths(download_path, sparse_paths)
+            if not pull_if_exists:
+                logger.info(f"Repository {self.org}/{repo} already downloaded")
+                if self._index is not None:
+                    self._index.touch(download_path)
+                return download_path
+
+            logger.info(f"Updating repository {repo}")
+            # the remote history may have been rewritten, so it is not merged
+            self._git(download_path, "fetch", *self._fetch_options(), "origin", "HEAD")
+            self._git(download_path, "reset", "--hard", "FETCH_HEAD")
+        else:
+            logger.info(f"Cloning repository {repo}")
+            options = self._fetch_options()
+            options += [] if sparse_paths is None else ["--sparse"]
+            if reference is not None:
+                reference_path = self._reference_path(reference)
+                options += ["--reference-if-able", str(reference_path)]
+            if self._remote is None:
+                clone = ["gh", "repo", "clone", f"{self.org}/{repo}", repo, "--"]
+                self._run(download_path.parent, *clone, *options)
+            else:
+                remote = self._remote.format(org=self.org, repo=repo)
+                self._git(download_path.parent, "clone", *options, remote, repo)
+            self._set_sparse_paths(download_path, sparse_paths)
+            if reference is not None:
+                self._seed_reference(reference, download_path)
+
+        logger.info(f"Repository {self.org}/{repo} downloaded")
+        if self._index is not None:
+            self._index.touch(download_path, dir_size(download_path))
+
+        return download_path
+
+    def _fetch_options(self):
+        match self._fetch:
+            case FetchMode.full:
+                return []
+            case FetchMode.shallow:
+                return ["--depth", "1"]
+            case FetchMode.partial:
+                return ["--filter=blob:none"]
+
+    def _reference_path(self, reference: str):
+        return self.download_dir / self.org / REFERENCES_DIR / f"{reference}.git"
+
+    def _seed_reference(self, reference: str, repo_path: Path):
+        """
+        Creates the reference repository with the objects of the repository, if it
+        does not exist. It fetches the whole history from the remote when the
+        repository is shallow or partial, as a reference must be complete.
+        """
+        path = self._reference_path(reference)
+        if path.exists():
+            return
+
+        with FileLock(path.with_suffix(".lock")):
+            if path.exists():
+                return
+            logger.info(f"Creating reference repository {reference} from {repo_path}")
+            source = str(repo_path)
+            if self._fetch != FetchMode.full:
+                get_url = ["git", "remote", "get-url", "origin"]
+                process = run(get_url, cwd=repo_path, stdout=PIPE, text=True)
+                source = process.stdout.strip()
+
+            temp_path = path.with_suffix(".tmp")
+            shutil.rmtree(temp_path, ignore_errors=True)
+            try:
+                self._git(path.parent, "init", "--quiet", "--bare", temp_path.name)
+                # other repositories borrow its objects, so they must never be pruned
+                self._git(temp_path, "config", "gc.auto", "0")
+                self._git(temp_path, "fetch", "--no-tags", source, "+HEAD:refs/seed")
+                temp_path.rename(path)
+            except RepositoryDownloadException:
+                logger.exception(f"Failed to create reference repository {reference}")
+                shutil.rmtree(temp_path, ignore_errors=True)
+
+    def _set_sparse_paths(self, repo_path: Path, sparse_paths: list[str] | None):
+        if sparse_paths is not None:
+            patterns = ["/" + path.lstrip("/") for path in sparse_paths]
+            self._git(repo_path, "sparse-checkout", "set", "--no-cone", *patterns)
+        elif (repo_path / ".git" / "info" / "sparse-checkout").exists():
+            self._git(repo_path, "sparse-checkout", "disable")
+
+    def _git(self, cwd: Path, *args: str):
+        self._run(cwd, "git", *args)
+
+    def _run(self, cwd: Path, *command: str):
+        process = run(command, cwd=cwd, stdout=PIPE, stderr=PIPE, text=True)
+        if process.returncode != 0:
+            error = process.stderr.strip()
+            raise RepositoryDownloadException(f"{' '.join(command)} failed: {error}")
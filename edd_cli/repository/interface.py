@@ -0,0 +1,13 @@
+from enum import Enum
+
+
+class RepositoryDownloadException(Exception):
+    pass
+
+
+class FetchMode(str, Enum):
+    full = "full"
+    # only the last commit
+    shallow = "shallow"
+    # every commit, but file contents are downloaded only when checked out
+    partial = "partial"
@@ -1,15 +1,46 @@
-from .environment import Environment
-from .run import Orchestrator
-from .runners import AbstractRunner, DirectRunner, DockerRunner, RunErrorException
-from .temp_dirs import TempDirGenerator, TempDirGeneratorFactory
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+from .runners import AbstractRunner, RunErrorException, RunnerKind, create_runner
+
+if TYPE_CHECKING:
+    from .environment import Environment
+    from .run import Orchestrator
+    from .runners import DirectRunner, DockerPoolRunner, DockerRunner, NamespaceRunner
+    from .temp_dirs import TempDirGenerator, TempDirGeneratorFactory, is_stage_dir
+
+# Imported when used, so commands that only need `RunnerKind` start fast
+_LAZY_MODULES = {
+    "DirectRunner": ".runners",
+    "DockerRunner": ".runners",
+    "DockerPoolRunner": ".runners",
+    "NamespaceRunner": ".runners",
+    "Environment": ".environment",
+    "Orchestrator": ".run",
+    "TempDirGenerator": ".temp_dirs",
+    "TempDirGeneratorFactory": ".temp_dirs",
+    "is_stage_dir": ".temp_dirs",
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_LAZY_MODULES[name], __name__), name)
+
 
 __all__ = [
     "AbstractRunner",
     "DirectRunner",
     "DockerRunner",
+    "DockerPoolRunner",
+    "NamespaceRunner",
     "Orchestrator",
     "Environment",
     "TempDirGenerator",
     "TempDirGeneratorFactory",
+    "is_stage_dir",
     "RunErrorException",
+    "RunnerKind",
+    "create_runner",
 ]
@@ -1,13 +1,16 @@
 from logging import getLogger
 from pathlib import Path
-from shutil import rmtree
+from statistics import median
+
+from pydantic import BaseModel
 
 from edd_cli.runner.runners.interface import RunErrorException
 
-from ..schema.results import TestOkResult
+from ..schema.results import TestOkResult, TimeStats
 from ..schema.tests import AbstractPipeline, PathMapping, ResolvedTestStage
 from ..utils.paths import path_to_show
 from .runners import AbstractRunner
+from .runners.usage import read_usage
 from .temp_dirs import TempDirGenerator, TempDir
 
 logger = getLogger(__name__)
@@ -22,6 +25,23 @@ class InvalidResultException(Exception):
     "Raised when the last command does not output a valid result (float)."
 
 
+class StageSamples(BaseModel):
+    "Measured runs of a stage, `None` when the runner does not report the usage."
+    wall_times: list[float]
+    cpu_times: list[float] | None
+    max_rss: int | None
+
+    @classmethod
+    def merge(cls, samples: "list[StageSamples]"):
+        cpu_times = [s.cpu_times for s in samples]
+        max_rss = [s.max_rss for s in samples]
+        return cls(
+            wall_times=[t for s in samples for t in s.wall_times],
+            cpu_times=None if None in cpu_times else [t for c in cpu_times for t in c],
+            max_rss=None if None in max_rss else max(max_rss),
+        )
+
+
 class Environment:
     """"""
 
@@ -32,12 +52,18 @@ class Environment:
         dir_generator: TempDirGenerator,
         *,
         starting_time=0,
+        starting_cpu_time: float | None = 0,
+        starting_max_rss: int | None = 0,
+        starting_timings: list[TimeStats] | None = None,
     ) -> None:
 
         self._dir = initial_dir
         self._runner = runner
         self._dir_generator = dir_generator
         self._time = starting_time
+        self._cpu_time = starting_cpu_time
+        self._max_rss = starting_max_rss
+        self._timings = list(starting_timings or [])
         self._last_step: ResolvedTestStage | None = None
         self._last_group: AbstractPipeline | None = None
 
@@ -53,29 +79,38 @@ class Environment:
             name = group.display_name
             considered_in_time = unresolved_step.time_it
 
-            self._dir = runner_dir.path
-
             if runner_dir.cached:
                 logger.info(f"[cache hit] Skipping {name}[{i}]: {command}")
             else:
                 logger.info(f"[cache miss] Running {name}[{i}]: {command}")
-                self.__run(runner_dir, command)
+                self.__run(runner_dir, self._last_step)
 
-            self._time += self._get_current_step_time() if considered_in_time else 0
+            self._dir = runner_dir.path
+
+            self._add_current_step_usage(considered_in_time)
 
-    def __run(self, runner_dir: TempDir, command: list[str]):
-        runner_dir.prepare()  # init dir
+    def __run(self, runner_dir: TempDir, step: ResolvedTestStage):
         try:
-            self._runner.run(command, self._dir)
-        except Exception:
+            self._dir = runner_dir.prepare()  # init dir
+            self._runner.run(step.command, self._dir)
+            if step.repeat > 1 or step.warmup > 0:
+                self._repeat_run(step)
+            runner_dir.finish()
+        except BaseException:
             # rm if failed
-            rmtree(self._dir, ignore_errors=True)
+            runner_dir.discard()
             raise
 
     def clone(self):
         "Clone the environment, starting the current environment directory."
         return Environment(
-            self._dir, self._runner, self._dir_generator, starting_time=self._time
+            self._dir,
+            self._runner,
+            self._dir_generator,
+            starting_time=self._time,
+            starting_cpu_time=self._cpu_time,
+            starting_max_rss=self._max_rss,
+            starting_timings=self._timings,
         )
 
     def get_result(self):
@@ -86,8 +121,63 @@ class Environment:
             name=self._last_group.display_name,
             time=self._time,
             percentage=self._get_percentage(),
+            cpu_time=self._cpu_time,
+            max_rss=self._max_rss,
+            timings=self._timings,
         )
 
+    def _repeat_run(self, step: ResolvedTestStage):
+        """
+        Runs the command again in the prepared directory, saving the samples of
+        the measured runs. The first `warmup` runs, including the first one, are
+        not measured.
+        """
+        samples = [] if step.warmup > 0 else [self._measure_current_step()]
+        for i in range(1, step.warmup + step.repeat):
+            self._runner.run(step.command, self._dir)
+            if i >= step.warmup:
+                samples.append(self._measure_current_step())
+
+        merged = StageSamples.merge(samples)
+        self._samples_path().write_text(merged.model_dump_json())
+
+    def _add_current_step_usage(self, considered_in_time: bool):
+        "Adds the resources used by the last step, `None` if they were not measured."
+        samples = self._read_current_step_samples()
+        if samples.max_rss is None:
+            self._max_rss = None
+        elif self._max_rss is not None:
+            self._max_rss = max(self._max_rss, samples.max_rss)
+
+        if not considered_in_time:
+            return
+
+        if len(samples.wall_times) > 1:
+            self._timings.append(TimeStats.from_samples(samples.wall_times))
+
+        self._time += median(samples.wall_times)
+        if samples.cpu_times is None:
+            self._cpu_time = None
+        elif self._cpu_time is not None:
+            self._cpu_time += median(samples.cpu_times)
+
+    def _read_current_step_samples(self):
+        samples_path = self._samples_path()
+        if samples_path.is_file():
+            return StageSamples.model_validate_json(samples_path.read_text())
+        return self._measure_current_step()
+
+    def _measure_current_step(self):
+        usage = read_usage(self._dir)
+        return StageSamples(
+            wall_times=[self._get_current_step_time()],
+            cpu_times=None if usage is None else [usage.cpu_time],
+            max_rss=None if usage is None else usage.max_rss,
+        )
+
+    def _samples_path(self):
+        return self._dir.joinpath(f".samples.{self._dir.name}")
+
     def _get_current_step_time(self):
         time = float(self._dir.joinpath(f".time.{self._dir.name}").read_text())
         return time
@@ -1,7 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from ..schema.results import TestErrorResult, TestGroupErrorResults, TestGroupOkResults
-from ..schema.tests import TestGroup
+from ..schema.results import (
+    TestErrorResult,
+    TestGroupErrorResults,
+    TestGroupOkResults,
+    TestOkResult,
+)
+from ..schema.tests import TestCase, TestGroup
 from .environment import Environment
 from .runners import AbstractRunner, RunErrorException
 from .temp_dirs import TempDirGenerator
@@ -9,11 +15,17 @@ from .temp_dirs import TempDirGenerator
 
 class Orchestrator:
     def __init__(
-        self, repo_path: Path, runner: AbstractRunner, dir_generator: TempDirGenerator
+        self,
+        repo_path: Path,
+        runner: AbstractRunner,
+        dir_generator: TempDirGenerator,
+        *,
+        jobs: int = 1,
     ):
         self._repo_path = repo_path
         self._runner = runner
         self._dir_generator = dir_generator
+        self._jobs = max(jobs, 1)
         self._assignments_results: list[TestGroupErrorResults | TestGroupOkResults] = []
 
     def _create_env(self):
@@ -21,24 +33,27 @@ class Orchestrator:
 
     def run(self, test_groups: list[TestGroup]):
         for g in self.iter_run_assignment_group(test_groups):
-            for t in g.iter_run_group_test():
-                pass
+            if g.result.verdict == "ok":
+                for t in g.iter_run_group_test():
+                    pass
         return self.assignment_results
 
     def iter_run_assignment_group(self, test_groups: list[TestGroup]):
-        "Iter intermediate function, useful when login progress."
+        """
+        Iter intermediate function, useful when login progress.
+        Groups whose stages failed are yielded with an error result, without tests.
+        """
         for group in test_groups:
             environment = self._create_env()
             try:
                 environment.run_stages(group)
                 result = TestGroupOkResults(name=group.display_name)
-                self._assignments_results.append(result)
-                yield OrchestratorForGroup(result, group, environment)
             except RunErrorException as exception:
                 result = TestGroupErrorResults(
                     name=group.display_name, error=exception.message
                 )
-                self._assignments_results.append(result)
+            self._assignments_results.append(result)
+            yield OrchestratorForGroup(result, group, environment, jobs=self._jobs)
 
     @property
     def assignment_results(self):
@@ -51,10 +66,13 @@ class OrchestratorForGroup:
         result: TestGroupOkResults | TestGroupErrorResults,
         group: TestGroup,
         env: Environment,
+        *,
+        jobs: int = 1,
     ):
         self._group_result = result
         self._group = group
         self._env = env
+        self._jobs = max(jobs, 1)
 
     @property
     def result(self):
@@ -69,21 +87,36 @@ class OrchestratorForGroup:
         return self._group.tests
 
     def iter_run_group_test(self):
+        """
+        Runs every test of the group, yielding the results in the order of the tests.
+        With `jobs` greater than 1, up to `jobs` tests run at the same time.
+        """
         if not isinstance(self._group_result, TestGroupOkResults):
             raise ValueError(
                 f"Can't run tests on a errored group result {self._group_result.error}"
             )
 
-        for test in self._group.tests:
-            test_env = self._env.clone()
+        if self._jobs == 1:
+            for test in self._group.tests:
+                yield self._add_result(self._run_test(test))
+            return
+
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
             try:
-                test_env.run_stages(test)
-                test_result = test_env.get_result()
-                self._group_result.results.append(test_result)
-                yield test_result
-            except RunErrorException as exception:
-                test_result = TestErrorResult(
-                    name=test.display_name, error=exception.message
-                )
-                self._group_result.results.append(test_result)
-                yield test_result
+                for test_result in executor.map(self._run_test, self._group.tests):
+                    yield self._add_result(test_result)
+            finally:
+                executor.shutdown(cancel_futures=True)
+
+    def _run_test(self, test: TestCase) -> TestOkResult | TestErrorResult:
+        test_env = self._env.clone()
+        try:
+            test_env.run_stages(test)
+            return test_env.get_result()
+        except RunErrorException as exception:
+            return TestErrorResult(name=test.display_name, error=exception.message)
+
+    def _add_result(self, test_result: TestOkResult | TestErrorResult):
+        assert isinstance(self._group_result, TestGroupOkResults)
+        self._group_result.results.append(test_result)
+        return test_result
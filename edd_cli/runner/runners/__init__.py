@@ -1,5 +1,58 @@
-from .direct import DirectRunner
-from .docker import DockerRunner
+from enum import Enum
+from importlib import import_module
+from typing import TYPE_CHECKING
+
 from .interface import AbstractRunner, RunErrorException
 
-__all__ = ["AbstractRunner", "DockerRunner", "RunErrorException", "DirectRunner"]
+if TYPE_CHECKING:
+    from .direct import DirectRunner
+    from .docker import DockerRunner
+    from .docker_pool import DockerPoolRunner
+    from .namespace import NamespaceRunner
+
+# Runners are imported when used, as they import the result schemas
+_RUNNER_MODULES = {
+    "DirectRunner": ".direct",
+    "DockerRunner": ".docker",
+    "DockerPoolRunner": ".docker_pool",
+    "NamespaceRunner": ".namespace",
+}
+
+
+class RunnerKind(str, Enum):
+    docker = "docker"
+    docker_pool = "docker-pool"
+    namespace = "namespace"
+    direct = "direct"
+
+
+def create_runner(kind: RunnerKind, image: str | None = None) -> AbstractRunner:
+    "Creates a runner of the given kind, using `image` for the docker runners."
+    image_kwargs = {"image": image} if image else {}
+    match kind:
+        case RunnerKind.docker:
+            return __getattr__("DockerRunner")(**image_kwargs)
+        case RunnerKind.docker_pool:
+            return __getattr__("DockerPoolRunner")(**image_kwargs)
+        case RunnerKind.namespace:
+            return __getattr__("NamespaceRunner")()
+        case RunnerKind.direct:
+            return __getattr__("DirectRunner")()
+
+
+def __getattr__(name: str):
+    if name not in _RUNNER_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_RUNNER_MODULES[name], __name__), name)
+
+
+__all__ = [
+    "AbstractRunner",
+    "DockerRunner",
+    "DockerPoolRunner",
+    "RunErrorException",
+    "DirectRunner",
+    "NamespaceRunner",
+    "RunnerKind",
+    "create_runner",
+]
@@ -1,9 +1,9 @@
 from logging import getLogger
 from pathlib import Path
 from subprocess import Popen, TimeoutExpired
-from time import time
 
 from .interface import AbstractRunner, RunErrorException
+from .usage import usage_path, wait_with_usage, wrap_with_usage, write_usage
 
 logger = getLogger(__name__)
 
@@ -16,15 +16,18 @@ class DirectRunner(AbstractRunner):
 
     def run(self, command: list[str], dir: Path, timeout=10):
         stdout = dir.joinpath(f".stdout.{dir.name}").open("wb")
-        time_path = dir.joinpath(f".time.{dir.name}")
-        initial_time = time()
         try:
-            process = Popen(command, stdout=stdout, cwd=dir)
-            exit_code = process.wait(timeout=timeout)
-            time_path.write_text(str(time() - initial_time))
+            usage_file = usage_path(dir)
+            process = Popen(
+                wrap_with_usage(command, usage_file), stdout=stdout, cwd=dir
+            )
+            usage = wait_with_usage(process, timeout, usage_file)
+            write_usage(dir, usage)
 
-            if exit_code != 0:
-                raise RunErrorException(f"Command {command} failed: {exit_code}")
+            if usage.exit_code != 0:
+                raise RunErrorException(f"Command {command} failed: {usage.exit_code}")
 
         except TimeoutExpired:
             raise RunErrorException(f"Command {command} timed out")
+        finally:
+            stdout.close()
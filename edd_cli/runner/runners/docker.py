@@ -4,6 +4,7 @@ from subprocess import Popen, TimeoutExpired
 from time import time
 
 from .interface import AbstractRunner, RunErrorException
+from .usage import read_shell_usage, wrap_with_shell_usage, write_usage
 
 logger = getLogger(__name__)
 
@@ -23,15 +24,18 @@ class DockerRunner(AbstractRunner):
         return docker_command
 
     def run(self, command: list[str], dir: Path, timeout=10):
-        docker_command = self._create_docker_command(dir, command)
+        usage_file = f".times.{dir.name}"
+        measured_command = wrap_with_shell_usage(command, usage_file)
+        docker_command = self._create_docker_command(dir, measured_command)
         try:
             stdout = dir.joinpath(f".stdout.{dir.name}").open("wb")
-            time_path = dir.joinpath(f".time.{dir.name}")
             initial_time = time()
             process = Popen(docker_command, stdout=stdout)
             exit_code = process.wait(timeout=timeout)
 
-            time_path.write_text(str(time() - initial_time))
+            wall_time = time() - initial_time
+            usage = read_shell_usage(dir / usage_file, wall_time, exit_code)
+            write_usage(dir, usage)
 
             if exit_code != 0:
                 raise RunErrorException(f"Command {command} failed: {exit_code}")
@@ -0,0 +1,263 @@
+import atexit
+import shutil
+import tarfile
+from dataclasses import dataclass, field
+from logging import getLogger
+from pathlib import Path, PurePosixPath
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired, run
+from threading import Condition
+from time import monotonic, time
+
+from .interface import AbstractRunner, RunErrorException
+from .usage import read_shell_usage, wrap_with_shell_usage, write_usage
+
+logger = getLogger(__name__)
+
+WORK_DIR = "/app"
+
+# Writable directories of the containers, mounted as tmpfs on a read-only root
+WRITABLE_DIRS = [WORK_DIR, "/tmp"]
+
+# Kills every process of the container but the ones in `$KEEP`, which are the
+# init and main processes, and the shell running the script
+KILL_SCRIPT = """
+for round in 1 2 3; do
+    for dir in /proc/[0-9]*; do
+        pid=${dir#/proc/}
+        case " $$ $KEEP " in
+            *" $pid "*) ;;
+            *) kill -9 "$pid" 2>/dev/null ;;
+        esac
+    done
+done
+"""
+
+# Resets the container to its initial state, and extracts the stage from stdin
+STAGE_IN_SCRIPT = f"""
+{KILL_SCRIPT}
+for dir in {" ".join(WRITABLE_DIRS)} /dev/shm; do
+    rm -rf "$dir"/* "$dir"/.[!.]* "$dir"/..?*
+done
+tar -x -f - -C {WORK_DIR} --no-same-owner
+"""
+
+# Writes the stage to stdout, and kills what the command left running
+STAGE_OUT_SCRIPT = f"""
+tar -c -f - -C {WORK_DIR} .
+code=$?
+{KILL_SCRIPT}
+exit $code
+"""
+
+# Lists the processes of a new container, to keep them when killing the others
+PIDS_SCRIPT = (
+    'for dir in /proc/[0-9]*; do [ "${dir#/proc/}" = $$ ] || echo "${dir#/proc/}"; done'
+)
+
+
+@dataclass
+class _Container:
+    id: str
+    keep: str = ""
+    uses: int = 0
+    last_used: float = field(default_factory=monotonic)
+
+
+class DockerPoolRunner(AbstractRunner):
+    """
+    Runs commands with `docker exec` in a pool of long-lived containers.
+    Containers don't mount the stage directories: the stage is copied into a
+    tmpfs of the container before the command runs, and copied back after it.
+    Their root filesystem is read-only, and every use starts by killing the
+    processes left by the previous one and emptying the writable directories,
+    so stages (and users) sharing a container don't see each other.
+    Containers are recycled after `max_uses` runs, after a timeout, and when idle
+    for more than `idle_timeout` seconds.
+    """
+
+    protects_stage_files = True
+
+    def __init__(
+        self,
+        image="carlogauss33/edd-runner",
+        *,
+        max_size: int = 4,
+        max_uses: int = 50,
+        idle_timeout: float = 60,
+    ) -> None:
+        self._image = image
+        self._max_size = max_size
+        self._max_uses = max_uses
+        self._idle_timeout = idle_timeout
+        self._condition = Condition()
+        self._idle: list[_Container] = []
+        self._size = 0
+        atexit.register(self.close)
+
+    def _create_docker_command(self, container: _Container, command: list[str]):
+        docker_command = ["docker", "exec"]
+        docker_command += ["--workdir", WORK_DIR]
+        docker_command += [container.id]
+        docker_command += command
+        return docker_command
+
+    def run(self, command: list[str], dir: Path, timeout=10):
+        container = self._acquire()
+        usage_file = f".times.{dir.name}"
+        measured_command = wrap_with_shell_usage(command, usage_file)
+        docker_command = self._create_docker_command(container, measured_command)
+        reusable = False
+        try:
+            self._stage_in(container, dir)
+            with dir.joinpath(f".stdout.{dir.name}").open("wb") as stdout:
+                initial_time = time()
+                process = Popen(docker_command, stdin=DEVNULL, stdout=stdout)
+                try:
+                    exit_code = process.wait(timeout=timeout)
+                except TimeoutExpired:
+                    process.kill()
+                    raise RunErrorException(f"Command {command} timed out")
+
+            wall_time = time() - initial_time
+            self._stage_out(container, dir)
+            # the container ran other commands, its peak memory is not of this one
+            usage = read_shell_usage(
+                dir / usage_file, wall_time, exit_code, memory=False
+            )
+            write_usage(dir, usage)
+            reusable = True
+
+            if exit_code != 0:
+                raise RunErrorException(f"Command {command} failed: {exit_code}")
+
+        finally:
+            self._release(container, reusable)
+
+    def _stage_in(self, container: _Container, dir: Path):
+        "Resets the container and copies the files of the stage into `WORK_DIR`."
+        docker_command = ["docker", "exec", "--interactive"]
+        docker_command += ["--env", f"KEEP={container.keep}", container.id]
+        docker_command += ["sh", "-c", STAGE_IN_SCRIPT]
+        process = Popen(docker_command, stdin=PIPE, stdout=DEVNULL, stderr=PIPE)
+        assert process.stdin is not None and process.stderr is not None
+        try:
+            with tarfile.open(fileobj=process.stdin, mode="w|") as tar:
+                tar.add(dir, arcname=".")
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+        error = process.stderr.read()
+        if process.wait() != 0:
+            raise RunErrorException(f"Failed to copy the stage: {error.decode()}")
+
+    def _stage_out(self, container: _Container, dir: Path):
+        """
+        Replaces the files of the stage with the ones in `WORK_DIR`, but the stdout.
+        Files are removed before, as they may be hardlinks to the test files.
+        """
+        stdout_name = f".stdout.{dir.name}"
+        for entry in dir.iterdir():
+            if entry.name == stdout_name:
+                continue
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+
+        docker_command = ["docker", "exec", "--env", f"KEEP={container.keep}"]
+        docker_command += [container.id, "sh", "-c", STAGE_OUT_SCRIPT]
+        process = Popen(docker_command, stdout=PIPE, stderr=PIPE)
+        assert process.stdout is not None and process.stderr is not None
+
+        def stage_filter(member: tarfile.TarInfo, path: str):
+            if PurePosixPath(member.name) == PurePosixPath(stdout_name):
+                return None
+            # the files were written by the command, like an untrusted archive
+            return tarfile.data_filter(member, path)
+
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                tar.extractall(dir, filter=stage_filter)
+        except (tarfile.TarError, OSError) as error:
+            process.kill()
+            process.wait()
+            raise RunErrorException(f"Failed to copy the stage back: {error}")
+        error = process.stderr.read()
+        if process.wait() != 0:
+            raise RunErrorException(f"Failed to copy the stage back: {error.decode()}")
+
+    def close(self):
+        "Removes every idle container."
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for container in idle:
+            self._remove(container)
+
+    def _acquire(self) -> _Container:
+        with self._condition:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+
+                if self._size < self._max_size:
+                    self._size += 1
+                    break
+
+                self._condition.wait()
+
+        try:
+            return self._start()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, container: _Container, reusable: bool):
+        container.uses += 1
+        container.last_used = monotonic()
+        expired: list[_Container] = []
+
+        with self._condition:
+            if reusable and container.uses < self._max_uses:
+                self._idle.append(container)
+            else:
+                expired.append(container)
+
+            # shrink the pool when the load goes down
+            deadline = monotonic() - self._idle_timeout
+            expired += [c for c in self._idle if c.last_used < deadline]
+            self._idle = [c for c in self._idle if c.last_used >= deadline]
+            self._size -= len(expired)
+            self._condition.notify(len(expired) + 1)
+
+        for c in expired:
+            self._remove(c)
+
+    def _start(self) -> _Container:
+        docker_command = ["docker", "run", "--detach", "--rm", "--init"]
+        docker_command += ["--read-only"]
+        for dir in WRITABLE_DIRS:
+            docker_command += ["--tmpfs", f"{dir}:exec"]
+        docker_command += ["--entrypoint", "tail"]
+        docker_command += [self._image, "-f", "/dev/null"]
+        process = run(docker_command, stdout=PIPE, stderr=PIPE, text=True)
+        if process.returncode != 0:
+            raise RunErrorException(f"Failed to start container: {process.stderr}")
+        container = _Container(id=process.stdout.strip())
+
+        pids_command = ["docker", "exec", container.id, "sh", "-c", PIDS_SCRIPT]
+        process = run(pids_command, stdout=PIPE, stderr=PIPE, text=True)
+        if process.returncode != 0:
+            self._remove(container)
+            raise RunErrorException(f"Failed to start container: {process.stderr}")
+        container.keep = " ".join(process.stdout.split())
+
+        logger.debug(f"Started container {container.id[:12]}")
+        return container
+
+    def _remove(self, container: _Container):
+        logger.debug(f"Removing container {container.id[:12]}")
+        run(["docker", "rm", "--force", container.id], stdout=DEVNULL, stderr=DEVNULL)
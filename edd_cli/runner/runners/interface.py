@@ -13,6 +13,10 @@ class RunErrorException(Exception):
 class AbstractRunner(ABC):
     "Interface for running commands in a directory."
 
+    # If commands never write the files of the directory in place, so the files
+    # can be hardlinks to files that must not change, like the test suite
+    protects_stage_files: bool = False
+
     @abstractmethod
     def run(self, command: list[str], dir: Path):
         """
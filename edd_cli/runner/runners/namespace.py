@@ -0,0 +1,81 @@
+import shutil
+from logging import getLogger
+from pathlib import Path
+from subprocess import Popen, TimeoutExpired
+
+from .interface import AbstractRunner, RunErrorException
+from .usage import usage_path, wait_with_usage, wrap_with_usage, write_usage
+
+logger = getLogger(__name__)
+
+SANDBOX_SETUP_FAILED = 125
+
+# Runs inside the new namespaces: every mount is made read-only except the stage
+# directory, /tmp is replaced by an empty tmpfs, and the limits are applied.
+SANDBOX_SCRIPT = """
+dir="$1" cpu="$2" memory="$3" files="$4"
+shift 4
+while read -r _ mount_point _; do
+    mount -o remount,bind,ro "$mount_point" 2>/dev/null
+done < /proc/self/mounts
+mount --bind "$dir" "$dir" && mount -o remount,bind,rw "$dir" || exit 125
+cd "$dir" || exit 125
+mount -t tmpfs tmpfs /tmp || exit 125
+ulimit -t "$cpu" && ulimit -v "$memory" && ulimit -n "$files" || exit 125
+exec "$@"
+"""
+
+
+class NamespaceRunner(AbstractRunner):
+    """
+    Runs the command in the stage directory, isolated with Linux namespaces.
+    Uses `unshare` to create user, mount, pid and network namespaces, so it does not
+    require root or a docker daemon. The host filesystem is visible as read-only.
+    """
+
+    def __init__(
+        self,
+        *,
+        cpu_time: int = 10,
+        memory: int = 2 * 1024 * 1024 * 1024,
+        open_files: int = 256,
+        network: bool = False,
+    ) -> None:
+        self._cpu_time = cpu_time
+        self._memory = memory
+        self._open_files = open_files
+        self._network = network
+
+    def _create_sandbox_command(self, dir: Path, command: list[str]):
+        sandbox_command = ["unshare", "--user", "--map-root-user", "--mount"]
+        sandbox_command += ["--pid", "--fork", "--kill-child", "--mount-proc"]
+        sandbox_command += [] if self._network else ["--net"]
+        sandbox_command += ["--", "sh", "-c", SANDBOX_SCRIPT, "sandbox", str(dir)]
+        sandbox_command += [str(self._cpu_time), str(self._memory // 1024)]
+        sandbox_command += [str(self._open_files)]
+        sandbox_command += command
+        return sandbox_command
+
+    def run(self, command: list[str], dir: Path, timeout=10):
+        if shutil.which("unshare") is None:
+            raise RunErrorException("The namespace runner requires `unshare`")
+
+        sandbox_command = self._create_sandbox_command(dir, command)
+        usage_file = usage_path(dir)
+        with dir.joinpath(f".stdout.{dir.name}").open("wb") as stdout:
+            try:
+                # killing `unshare` kills every process of the sandbox
+                process = Popen(
+                    wrap_with_usage(sandbox_command, usage_file), stdout=stdout
+                )
+                usage = wait_with_usage(process, timeout, usage_file)
+            except TimeoutExpired:
+                raise RunErrorException(f"Command {command} timed out")
+
+        write_usage(dir, usage)
+        exit_code = usage.exit_code
+
+        if exit_code == SANDBOX_SETUP_FAILED:
+            raise RunErrorException(f"Failed to create sandbox for {command}")
+        if exit_code != 0:
+            raise RunErrorException(f"Command {command} failed: {exit_code}")
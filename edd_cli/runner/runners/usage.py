@@ -0,0 +1,174 @@
+import re
+import sys
+from pathlib import Path
+from subprocess import Popen, TimeoutExpired
+from threading import Event, Timer
+from time import time
+
+from ...schema.results import ResourceUsage
+
+# Wraps a command run by `sh` where the runner can't wait for the process itself
+# (inside a container). Writes the exit code, start and end time in nanoseconds,
+# the cgroup peak memory in bytes, and the output of `times` to the file `$1`.
+# The peak is of the whole container, as it can't be reset reliably.
+SHELL_USAGE_SCRIPT = """
+usage="$1"; shift
+start=$(date +%s%N)
+"$@"
+code=$?
+end=$(date +%s%N)
+peak=0
+for file in /sys/fs/cgroup/memory.peak /sys/fs/cgroup/memory/memory.max_usage_in_bytes
+do
+    [ -r "$file" ] && read -r peak < "$file" && break
+done
+{ echo "$code $start $end $peak"; times; } > "$usage"
+exit $code
+"""
+
+# Runs the command `$2...` as its child and writes its exit code, wall time and
+# `wait4` usage to the file `$1`. A child starts with the memory of its parent
+# counted in `ru_maxrss`, so the command is forked from this small process instead
+# of the runner. SIGTERM kills the command.
+USAGE_SCRIPT = """
+import os, signal, sys, time
+signal.signal(signal.SIGTERM, lambda *_: os.kill(pid, signal.SIGKILL))
+signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGTERM])
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGTERM])
+        os.execvp(sys.argv[2], sys.argv[2:])
+    finally:
+        os._exit(127)
+signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGTERM])
+_, status, usage = os.wait4(pid, 0)
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+end = time.perf_counter()
+code = os.waitstatus_to_exitcode(status)
+with open(sys.argv[1], "w") as file:
+    file.write(f"{code} {end - start} {usage.ru_utime} {usage.ru_stime} {usage.ru_maxrss}")
+sys.exit(code if code >= 0 else 128 - code)
+"""
+
+TIMES_PATTERN = re.compile(r"(\d+)m([\d.]+)s")
+
+
+def usage_path(dir: Path):
+    return dir.joinpath(f".usage.{dir.name}")
+
+
+def write_usage(dir: Path, usage: ResourceUsage):
+    "Persists the usage next to the stdout of the stage."
+    usage_path(dir).write_text(usage.model_dump_json())
+    dir.joinpath(f".time.{dir.name}").write_text(str(usage.wall_time))
+
+
+def read_usage(dir: Path) -> ResourceUsage | None:
+    "Reads the usage of the stage, `None` if it was run without usage accounting."
+    path = usage_path(dir)
+    if not path.is_file():
+        return None
+    return ResourceUsage.model_validate_json(path.read_text())
+
+
+def wrap_with_usage(command: list[str], usage_file: Path):
+    "Wraps the command so `USAGE_SCRIPT` writes its usage to `usage_file`."
+    return [sys.executable, "-I", "-S", "-c", USAGE_SCRIPT, str(usage_file)] + command
+
+
+def wait_with_usage(process: Popen, timeout: float, usage_file: Path):
+    """
+    Waits for the process, a command wrapped with `wrap_with_usage`, like
+    `Popen.wait`, and reads and removes its `usage_file`. The usage includes every
+    descendant of the command that was waited for, and `max_rss` only counts the
+    small wrapper process on top of the command, not this one.
+    @throws TimeoutExpired after killing the command if it does not finish in time.
+    """
+    timed_out = Event()
+
+    def kill():
+        timed_out.set()
+        process.terminate()
+
+    initial_time = time()
+    timer = Timer(timeout, kill)
+    timer.start()
+    try:
+        process.wait()
+    finally:
+        timer.cancel()
+
+    wall_time = time() - initial_time
+    if timed_out.is_set():
+        usage_file.unlink(missing_ok=True)
+        raise TimeoutExpired(process.args, timeout)
+
+    try:
+        code, wall_time, user_time, system_time, max_rss = (
+            usage_file.read_text().split()
+        )
+        usage_file.unlink()
+    except (OSError, ValueError):
+        # the wrapper itself failed, so nothing was measured
+        return ResourceUsage(
+            wall_time=wall_time,
+            user_time=0,
+            system_time=0,
+            max_rss=None,
+            exit_code=process.returncode,
+        )
+
+    return ResourceUsage(
+        wall_time=float(wall_time),
+        user_time=float(user_time),
+        system_time=float(system_time),
+        max_rss=int(max_rss),
+        exit_code=int(code),
+    )
+
+
+def wrap_with_shell_usage(command: list[str], usage_file: str):
+    "Wraps the command so `sh` writes its usage to `usage_file`."
+    return ["sh", "-c", SHELL_USAGE_SCRIPT, "sh", usage_file] + command
+
+
+def read_shell_usage(
+    path: Path, wall_time: float, exit_code: int, *, memory: bool = True
+) -> ResourceUsage:
+    """
+    Reads and removes the file written by `SHELL_USAGE_SCRIPT`.
+    Uses the given `wall_time` and `exit_code` when the file is missing or incomplete.
+    The peak memory is of the container, so `memory` must be false for containers
+    that ran other commands before, leaving `max_rss` unset.
+    """
+    try:
+        header, *times = path.read_text().splitlines()
+        path.unlink()
+    except (OSError, ValueError):
+        return ResourceUsage(
+            wall_time=wall_time,
+            user_time=0,
+            system_time=0,
+            max_rss=0 if memory else None,
+            exit_code=exit_code,
+        )
+
+    code, start, end, peak = (header.split() + ["", "", "", ""])[:4]
+    if start.isdigit() and end.isdigit():
+        wall_time = (int(end) - int(start)) / 1e9
+
+    # `times` prints the shell times and then the times of its children
+    children = TIMES_PATTERN.findall(times[-1]) if times else []
+    user_time, system_time = [int(m) * 60 + float(s) for m, s in children] or [0, 0]
+    max_rss = int(peak) // 1024 if peak.isdigit() else 0
+
+    return ResourceUsage(
+        wall_time=wall_time,
+        user_time=user_time,
+        system_time=system_time,
+        max_rss=max_rss if memory else None,
+        exit_code=int(code) if code.lstrip("-").isdigit() else exit_code,
+    )
@@ -1,60 +1,248 @@
 import hashlib
+import os
 import shutil
 from pathlib import Path
+from string import hexdigits
+from typing import Iterable
 
+from ..cache import BLOBS_DIR, HASH_INDEX_FILE, BlobStore, CacheIndex, FileHashIndex
 from ..schema.tests import PathMapping, ResolvedTestStage
-from ..utils.hash import file_digest
+from ..utils.dir import dir_size
+from ..utils.files import link_or_copy, reflink_or_copy
+from ..utils.lock import FileLock
+
+SHARED_DIR = "shared"
+
+BUILD_DIR = ".building"
+
+# Path, size, modification time and SHA-256 digest of a file
+KnownDigest = tuple[Path, int, int, bytes]
+
+
+def is_stage_dir(path: Path):
+    "If the directory is named like a stage key (a SHA-256 in hex)."
+    return len(path.name) == 64 and all(c in hexdigits for c in path.name)
 
 
 class TempDirGeneratorFactory:
-    def __init__(self, base_path: Path):
+    """
+    Creates generators under `base_path`, scoped by `subpath`.
+    With `shared`, every cached generator uses the same directory, so identical
+    stages of different subpaths (users) are run once.
+    """
+
+    def __init__(
+        self,
+        base_path: Path,
+        *,
+        shared: bool = False,
+        link_include: bool = False,
+        deduplicate: bool = False,
+        index: CacheIndex | None = None,
+    ):
         self._base_path = base_path
+        self._shared = shared
+        self._link_include = link_include
+        self._index = index
+        self.hash_index = FileHashIndex.for_path(base_path / HASH_INDEX_FILE)
+        self.blob_store = (
+            BlobStore(base_path / BLOBS_DIR, self.hash_index, index=index)
+            if deduplicate
+            else None
+        )
 
     def create(self, *, cache: bool, subpath: Path = Path()):
-        return TempDirGenerator(self._base_path / subpath, cache)
+        if self._shared and cache:
+            subpath = Path(SHARED_DIR)
+        return TempDirGenerator(
+            self._base_path / subpath,
+            cache,
+            self.hash_index,
+            link_include=self._link_include,
+            blob_store=self.blob_store,
+            index=self._index,
+        )
+
+    def remember_digests(self, digests: Iterable[KnownDigest]):
+        "Adds digests computed elsewhere, like in a suite manifest, to the hash index."
+        _remember_digests(self.hash_index, digests)
 
 
 class TempDirGenerator:
-    "Creates temporary directories for test stages."
-
-    def __init__(self, base_path: Path, cache: bool = True):
+    """
+    Creates temporary directories for test stages.
+    With `link_include`, the `include` files of the test suite are hardlinked
+    instead of copied. Only for runners that `protects_stage_files`, as any other
+    runner can write the test suite through the links.
+    With a `blob_store`, the files of finished stages are deduplicated.
+    With an `index`, the use and size of the stage directories are recorded.
+    Stages are built in `BUILD_DIR` and renamed when finished, holding a lock per
+    stage key, so processes sharing the directory wait for a stage being built
+    instead of building it again, and never see a partial stage.
+    Without `cache`, stages built by this generator are still reused, so tests
+    running at once that share a stage don't replace it while it is being read.
+    """
+
+    def __init__(
+        self,
+        base_path: Path,
+        cache: bool = True,
+        hash_index: FileHashIndex | None = None,
+        *,
+        link_include: bool = False,
+        blob_store: BlobStore | None = None,
+        index: CacheIndex | None = None,
+    ):
         self.base_path = base_path
         self.cache = cache
+        self.link_include = link_include
+        self._blob_store = blob_store
+        self._index = index
+        self._hash_index = hash_index or FileHashIndex.for_path(
+            base_path / HASH_INDEX_FILE
+        )
+        self._built: set[Path] = set()
 
     def create(self, stage: ResolvedTestStage):
-        file_hash = hashlib.sha256()
-        for file in stage.files:
-            file_digest(open(file.source, "rb"), lambda: file_hash)
-
-        stage_hash = hashlib.md5()
-        stage_hash.update(stage.model_dump_json().encode())
-
-        dir_name = f"{stage_hash.hexdigest()}-{file_hash.hexdigest()}"
+        dir_name = self._stage_key(stage)
         path = (self.base_path / dir_name).resolve()
 
-        cached = self.cache and path.exists() and path.is_dir()
+        lock = None
+        cached = self._is_cached(path)
+        if not cached:
+            lock = FileLock(self.base_path / BUILD_DIR / f"{dir_name}.lock")
+            lock.acquire()
+            # it may have been built while waiting for the lock
+            cached = self._is_cached(path)
+            if cached:
+                lock.release()
+                lock = None
+
+        if cached and self._index is not None:
+            self._index.touch(path)
+
+        links = stage.include if self.link_include else []
+        return TempDir(
+            path,
+            stage.files,
+            cached,
+            links=links,
+            blob_store=self._blob_store,
+            index=self._index,
+            lock=lock,
+            built=self._built,
+        )
+
+    def _is_cached(self, path: Path):
+        return (self.cache or path in self._built) and path.is_dir()
+
+    def remember_digests(self, digests: Iterable[KnownDigest]):
+        "Adds digests computed elsewhere, like in a suite manifest, to the hash index."
+        _remember_digests(self._hash_index, digests)
+
+    def _stage_key(self, stage: ResolvedTestStage):
+        """
+        Content address of the stage: the command and options, and the target path
+        and content of every file. Source paths are not included, so the same
+        stage of different repositories or users has the same key.
+        """
+        stage_hash = hashlib.sha256()
+        exclude = {"include", "require"}
+        options = stage.model_dump_json(exclude=exclude, exclude_defaults=True)
+        stage_hash.update(options.encode())
+        for file in stage.files:
+            stage_hash.update(f"\0{file.target.as_posix()}\0".encode())
+            stage_hash.update(self._hash_index.digest(file.source))
+        self._hash_index.save_if_needed()
+        return stage_hash.hexdigest()
 
-        if cached and not self.cache:
-            shutil.rmtree(path)
 
-        return TempDir(path, stage.files, cached)
+def _remember_digests(hash_index: FileHashIndex, digests: Iterable[KnownDigest]):
+    for path, size, mtime_ns, digest in digests:
+        hash_index.remember(path, size, mtime_ns, digest)
+    hash_index.save_if_needed()
 
 
 class TempDir:
-    "Temporary directory with files. Does not exist until `prepare` is called."
-
-    def __init__(self, path: Path, files: list[PathMapping], cached: bool):
+    """
+    Temporary directory with files. Does not exist until `prepare` is called,
+    which creates it in a build directory with the same name, and is published
+    to `path` by `finish`. Holds the `lock` of the stage while it is built.
+    Published paths are added to `built`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        files: list[PathMapping],
+        cached: bool,
+        *,
+        links: list[PathMapping] | None = None,
+        blob_store: BlobStore | None = None,
+        index: CacheIndex | None = None,
+        lock: FileLock | None = None,
+        built: set[Path] | None = None,
+    ):
         self.path = path
         self.cached = cached
+        self.build_path = path.parent / BUILD_DIR / path.name
         self._files = files
+        self._links = links or []
+        self._blob_store = blob_store
+        self._index = index
+        self._lock = lock
+        self._built = built
 
     def prepare(self):
-        if self.path.exists():
-            shutil.rmtree(self.path)
+        "Creates the directory with its files, returning the path to run in."
+        # left by a build that was interrupted, as the lock is held
+        shutil.rmtree(self.build_path, ignore_errors=True)
 
         for file in self._files:
-            target = self.path / file.target
+            target = self.build_path / file.target
             target.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy(file.source, target)
-
-        return self.path
+            if file in self._links:
+                link_or_copy(file.source, target)
+            else:
+                reflink_or_copy(file.source, target)
+
+        self.build_path.mkdir(parents=True, exist_ok=True)
+        return self.build_path
+
+    def finish(self):
+        """
+        Called after the command ran successfully, deduplicating the stage files
+        and publishing the directory.
+        """
+        try:
+            if self._blob_store is not None:
+                self._blob_store.deduplicate(self.build_path)
+            self._publish()
+            if self._built is not None:
+                self._built.add(self.path)
+            if self._index is not None:
+                # the blobs are counted by the store
+                size = dir_size(self.path, skip_linked=self._blob_store is not None)
+                self._index.touch(self.path, size)
+        finally:
+            self._release()
+
+    def discard(self):
+        "Called when the stage failed, removing the partial directory."
+        try:
+            shutil.rmtree(self.build_path, ignore_errors=True)
+        finally:
+            self._release()
+
+    def _publish(self):
+        if self.path.exists():
+            # rebuilt without cache, the old directory can't be replaced in place
+            old_path = self.build_path.with_name(f"{self.path.name}.old")
+            os.replace(self.path, old_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(self.build_path, self.path)
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
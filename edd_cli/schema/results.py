@@ -1,13 +1,47 @@
+from statistics import median
 from typing import Literal
 
 from pydantic import BaseModel, Field
 
 
+class ResourceUsage(BaseModel):
+    "Resources used by the command of a stage, as measured by the runner."
+    wall_time: float
+    user_time: float
+    system_time: float
+    max_rss: int | None = Field(description="Peak resident memory, in KiB, if measured")
+    exit_code: int
+
+    @property
+    def cpu_time(self):
+        return self.user_time + self.system_time
+
+
+class TimeStats(BaseModel):
+    "Statistics of the measured runs of a repeated `time-it` stage."
+    samples: list[float]
+    median: float
+    min: float
+    spread: float = Field(description="Difference between the slowest and fastest run")
+
+    @classmethod
+    def from_samples(cls, samples: list[float]):
+        return cls(
+            samples=samples,
+            median=median(samples),
+            min=min(samples),
+            spread=max(samples) - min(samples),
+        )
+
+
 class TestOkResult(BaseModel):
     verdict: Literal["ok"] = Field("ok", init=False)
     name: str
     time: float
     percentage: float
+    cpu_time: float | None = None
+    max_rss: int | None = None
+    timings: list[TimeStats] = Field(default_factory=list)
 
 
 class TestErrorResult(BaseModel):
@@ -1,7 +1,7 @@
 from datetime import datetime
 from pathlib import Path
 
-from pydantic import BaseModel, PrivateAttr
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class Assignment(BaseModel):
@@ -19,8 +19,15 @@ class PathMapping(BaseModel):
 
 class ResolvedTestStage(BaseModel):
     "The resolved files and command that will be run."
-    files: list[PathMapping]
+    include: list[PathMapping]
+    require: list[PathMapping]
     command: list[str]
+    repeat: int = 1
+    warmup: int = 0
+
+    @property
+    def files(self):
+        return self.include + self.require
 
 
 def resolve_paths(paths: list[str | PathMapping], base_dir: Path):
@@ -49,12 +56,16 @@ class TestStage(BaseModel):
     include: list[str | PathMapping]
     command: list[str]
     time_it: bool = False
+    repeat: int = Field(default=1, ge=1)
+    warmup: int = Field(default=0, ge=0)
 
     def with_resolved_paths(self, include_dir: Path, require_dir: Path):
-        files: list[PathMapping] = []
-        files.extend(resolve_paths(self.include, include_dir))
-        files.extend(resolve_paths(self.require, require_dir))
-        return ResolvedTestStage(files=files, command=self.command)
+        include = resolve_paths(self.include, include_dir)
+        require = resolve_paths(self.require, require_dir)
+        options = {"repeat": self.repeat, "warmup": self.warmup} if self.time_it else {}
+        return ResolvedTestStage(
+            include=include, require=require, command=self.command, **options
+        )
 
 
 class AbstractPipeline(BaseModel):
@@ -90,3 +101,16 @@ class TestGroup(AbstractPipeline):
     @property
     def tests(self):
         return self._tests
+
+    def repository_paths(self) -> list[str]:
+        """
+        Paths required from the repository, by the first stage of the group, or of
+        each test if the group has no stages.
+        """
+        pipelines = [self] if self.steps else self.tests
+        return [
+            path if isinstance(path, str) else path.source.as_posix()
+            for pipeline in pipelines
+            if pipeline.steps
+            for path in pipeline.steps[0].require
+        ]
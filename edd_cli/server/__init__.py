@@ -1,33 +1,123 @@
-from datetime import timedelta
+import asyncio
+import json
+import os
+from email.utils import parsedate_to_datetime
+from functools import partial
 from logging import getLogger
 from pathlib import Path
-from zipfile import ZipFile
+from threading import Thread
+from time import time
+from typing import Callable, Iterable, Literal
 
 import httpx
-from fastapi import APIRouter, BackgroundTasks, Depends, FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, HttpUrl
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
+from pydantic import BaseModel, Field, HttpUrl
 
-from ..finder import TestCaseFinder
+from ..cache import CacheEvictor, CacheIndex, remove_unused
+from ..finder import IndexedAssignment, TestCaseFinder
 from ..repository import RepositoryDownloader, RepositoryDownloadException
-from ..runner import DockerRunner, Orchestrator, TempDirGeneratorFactory
-from ..schema.results import AssignmentResults
+from ..runner import (
+    Orchestrator,
+    TempDirGeneratorFactory,
+    create_runner,
+    is_stage_dir,
+)
+from ..schema.results import AssignmentResults, TestGroupErrorResults
 from ..schema.tests import Assignment, TestGroup
-from ..utils.dir import dir_clear_old, dir_last_modified, dir_size
+from ..utils.dir import dir_size
+from ..utils.periodic import run_periodically
+from ..utils.single_flight import SingleFlight
+from .archives import SuiteArchives
 from .auth import verify_secret
+from .events import (
+    ErrorEvent,
+    Event,
+    EventChannel,
+    EventHub,
+    GroupEvent,
+    JobEvent,
+    ResultEvent,
+    TestEvent,
+    format_ndjson,
+    format_sse,
+)
+from .jobs import Job, JobQueue, JobRequest, JobStatus, QueueFullException
+from .results import ResultKey, ResultStore, StoredResults
 from .settings import settings
 
 logger = getLogger(__name__)
 
+output_index = CacheIndex(settings.output_temp_dir)
+repository_index = CacheIndex(settings.repository_download_dir)
+
 repo_downloader = RepositoryDownloader(
     org=settings.github_org,
     download_dir=settings.repository_download_dir,
+    index=repository_index,
+    remote=settings.repository_remote,
+    fetch=settings.repository_fetch,
+)
+
+runner = create_runner(settings.runner, image=settings.docker_image)
+runner_key = f"{settings.runner.value}:{settings.docker_image}"
+
+link_include = settings.link_include_files and runner.protects_stage_files
+if settings.link_include_files and not link_include:
+    logger.warning(f"The {settings.runner.value} runner can't use LINK_INCLUDE_FILES")
+
+dir_generator_factory = TempDirGeneratorFactory(
+    base_path=settings.output_temp_dir,
+    shared=settings.shared_cache,
+    link_include=link_include,
+    deduplicate=settings.deduplicate_cache,
+    index=output_index,
 )
+test_case_finder = TestCaseFinder(
+    settings.tests_directory, refresh_interval=settings.tests_refresh_interval
+)
+result_store = ResultStore(settings.results_database)
+suite_archives = SuiteArchives(settings.tests_archive_dir)
+
+if settings.output_cache_budget is not None:
+    CacheEvictor(
+        output_index,
+        settings.output_cache_budget,
+        blob_store=dir_generator_factory.blob_store,
+    ).start()
+
+if settings.repository_cache_budget is not None:
+    CacheEvictor(repository_index, settings.repository_cache_budget).start()
+
+
+def reconcile_cache_indexes():
+    """
+    Measures every cache entry again, fixing the counters of the indexes.
+    The blob store is measured apart, after collecting the blobs left by stages
+    removed without it, and the digests of removed files are forgotten.
+    """
+    blob_store = dir_generator_factory.blob_store
+    output_index.reconcile(
+        is_stage_dir,
+        max_depth=3,
+        size=partial(dir_size, skip_linked=blob_store is not None),
+    )
+    if blob_store is not None and blob_store.path.is_dir():
+        blob_store.collect_garbage()
+        output_index.set_size(blob_store.path, dir_size(blob_store.path))
+    dir_generator_factory.hash_index.prune()
+    repository_index.reconcile(lambda path: (path / ".git").is_dir(), max_depth=2)
 
-runner = DockerRunner(image=settings.docker_image)
 
-dir_generator_factory = TempDirGeneratorFactory(base_path=settings.output_temp_dir)
-test_case_finder = TestCaseFinder(settings.tests_directory)
+run_periodically(
+    reconcile_cache_indexes, settings.cache_reconcile_interval, "cache-reconcile"
+)
 
 
 app = FastAPI(
@@ -43,47 +133,114 @@ class CacheSize(BaseModel):
     output: int
 
 
+class CacheUsage(BaseModel):
+    "Size of the stage cache of a user, `None` for data shared between users."
+
+    assignment: str | None
+    user: str | None
+    size: int
+    entries: int
+
+
 @app.get("/cache", tags=["cache"])
 def get_cache_size() -> CacheSize:
-    repos = dir_size(settings.repository_download_dir)
-    output = dir_size(settings.output_temp_dir)
+    repos = repository_index.total_size()
+    output = output_index.total_size()
     return CacheSize(repos=repos, output=output)
 
 
+@app.get("/cache/usage", tags=["cache"])
+def get_cache_usage(by: Literal["assignment", "user"] = "user") -> list[CacheUsage]:
+    usage: dict[tuple[str | None, str | None], CacheUsage] = {}
+    for scope, size, entries in output_index.usage_by_scope():
+        parts = scope.split("/")
+        assignment, user = parts if len(parts) == 2 else (None, None)
+        key = (assignment, user if by == "user" else None)
+        total = usage.setdefault(
+            key, CacheUsage(assignment=key[0], user=key[1], size=0, entries=0)
+        )
+        total.size += size
+        total.entries += entries
+    return sorted(usage.values(), key=lambda u: u.size, reverse=True)
+
+
 @app.delete("/cache", tags=["cache"])
 def remove_cache(seconds_old: int) -> CacheSize:
-    delta = timedelta(seconds=seconds_old)
-    dir_clear_old(settings.repository_download_dir, delta)
-    dir_clear_old(settings.output_temp_dir, delta)
+    "Removes the repositories and stages not used in the last `seconds_old`."
+    used_before = time() - seconds_old
+    remove_unused(repository_index, used_before)
+    remove_unused(output_index, used_before, dir_generator_factory.blob_store)
     return get_cache_size()
 
 
+@app.get("/results/{assignment}", tags=["results"])
+def get_latest_results(assignment: str) -> list[StoredResults]:
+    "Returns the last stored results of every user, without running the tests."
+    return result_store.latest(assignment)
+
+
+@app.get("/results/{assignment}/{user}", tags=["results"])
+def get_results_history(
+    assignment: str, user: str, limit: int = 10
+) -> list[StoredResults]:
+    "Returns the stored results of the user, the newest first."
+    return result_store.history(assignment, user, limit)
+
+
 @app.get("/assignments", tags=["assignments"])
 def list_assignments() -> list[Assignment]:
     return test_case_finder.list_assignments()
 
 
 @app.get("/assignments/{assignment}.zip", tags=["assignments"])
-def download_assignment(assignment: str) -> FileResponse:
-    dir_path = test_case_finder.get_assignment_path(assignment)
-    if dir_path is None:
+async def download_assignment(assignment: str, request: Request) -> FileResponse:
+    """
+    Downloads the test suite. Supports conditional requests: the `ETag` is the
+    fingerprint of the suite, and `Last-Modified` the time its version was published.
+    """
+    suite = await run_in_threadpool(test_case_finder.get_indexed_assignment, assignment)
+    if suite is None:
         raise HTTPException(status_code=404, detail="Test suite not found")
 
-    zip_path = dir_path.with_suffix(".zip")
+    etag = f'"{suite.fingerprint}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    zip_path = await asyncio.wrap_future(suite_archives.get(suite))
+    stat = zip_path.stat()
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is None and _not_modified_since(if_modified_since, stat):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return FileResponse(
+        zip_path,
+        filename=f"{assignment}.zip",
+        stat_result=stat,
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
 
-    dir_mage = dir_last_modified(dir_path).timestamp()
+def _etag_matches(if_none_match: str, etag: str):
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
 
-    if not zip_path.is_file() or zip_path.stat().st_mtime < dir_mage:
-        with ZipFile(zip_path, "w") as zipf:
-            for file in dir_path.rglob("*"):
-                zipf.write(file, file.relative_to(dir_path))
 
-    return FileResponse(zip_path)
+def _not_modified_since(if_modified_since: str | None, stat: os.stat_result):
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have a resolution of seconds
+    return int(stat.st_mtime) <= since
 
 
 class CallbackResponse(BaseModel):
     user: str
     assignment: str
+    job: str
 
 
 def _run_tests(
@@ -92,32 +249,304 @@ def _run_tests(
     clean_run: bool,
     repo_path: Path,
     assignment_groups: list[TestGroup],
+    on_event: Callable[[Event], None] = lambda event: None,
 ) -> AssignmentResults:
+    "Runs the tests, calling `on_event` as each group and test finishes."
     dir_generator = dir_generator_factory.create(
         subpath=Path(assignment, user), cache=not clean_run
     )
 
-    results = Orchestrator(repo_path, runner, dir_generator).run(assignment_groups)
+    orchestrator = Orchestrator(repo_path, runner, dir_generator, jobs=settings.jobs)
+    for group in orchestrator.iter_run_assignment_group(assignment_groups):
+        if isinstance(group.result, TestGroupErrorResults):
+            on_event(
+                GroupEvent(name=group.name, verdict="error", error=group.result.error)
+            )
+            continue
 
+        on_event(GroupEvent(name=group.name, verdict="ok"))
+        for test in group.iter_run_group_test():
+            on_event(TestEvent(group=group.name, result=test))
+
+    results = orchestrator.assignment_results
     return AssignmentResults(name=assignment, user=user, results=results)
 
 
-def _run_tests_tasks(
+# Identical runs in flight, by result key and `clean_run`
+grading: SingleFlight[AssignmentResults] = SingleFlight()
+
+# Events of the runs in flight, by the same key, and of the running jobs
+grading_events = EventHub()
+job_events: dict[str, EventChannel] = {}
+
+
+# Fingerprints of the suites whose manifest digests are in the hash index
+remembered_suites: set[str] = set()
+
+
+def _remember_digests(suite: IndexedAssignment):
+    "Adds the digests of the manifest of the suite to the hash index, once."
+    if suite.manifest is None or suite.fingerprint in remembered_suites:
+        return
+    remembered_suites.add(suite.fingerprint)
+    dir_generator_factory.remember_digests(suite.manifest.digests(suite.path))
+
+
+def _sparse_paths(suite: IndexedAssignment):
+    "Paths of the repository used by the suite, if only they should be checked out."
+    if not settings.repository_sparse_checkout:
+        return None
+    paths = (path for group in suite.groups for path in group.repository_paths())
+    return list(dict.fromkeys(paths))
+
+
+def _grade(
+    key: ResultKey, clean_run: bool, repo_path: Path, suite: IndexedAssignment
+) -> AssignmentResults:
+    assignment, user = key.assignment, key.user
+    assignment_groups = list(suite.groups)
+    flight_key = (key, clean_run)
+    try:
+        results = _run_tests(
+            assignment,
+            user,
+            clean_run,
+            repo_path,
+            assignment_groups,
+            partial(grading_events.publish, flight_key),
+        )
+    finally:
+        grading_events.end(flight_key)
+    # errors may come from the server (like a timeout under load), so they are
+    # graded again after a while
+    reuse_for = settings.errored_results_reuse if _has_errors(results) else None
+    result_store.save(key, results, reuse_for)
+    return results
+
+
+def _has_errors(results: AssignmentResults):
+    return any(
+        group.verdict == "error"
+        or any(test.verdict == "error" for test in group.results)
+        for group in results.results
+    )
+
+
+def _run_job(job_id: str, request: JobRequest) -> AssignmentResults:
+    "Runs the job, publishing its events while it runs, and calls its callback."
+    channel = job_events[job_id] = EventChannel()
+    try:
+        results = _run_job_request(request, channel)
+    finally:
+        channel.close()
+        del job_events[job_id]
+
+    if request.callback_url:
+        _post_callback(job_id, request, results)
+    return results
+
+
+def _post_callback(job_id: str, request: JobRequest, results: AssignmentResults):
+    "Sends the results to the callback, recording in the job if it failed."
+    assignment, user = request.assignment, request.user
+    final_callback_url = str(request.callback_url) + f"/{assignment}/{user}"
+    try:
+        response = httpx.post(final_callback_url, content=results.model_dump_json())
+        logger.info(
+            f"Callback to {final_callback_url} returned {response.status_code}: "
+            f"{response.text}"
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as error:
+        logger.warning(f"Callback to {final_callback_url} failed: {error}")
+        job_queue.set_callback_error(job_id, str(error))
+
+
+def _run_job_request(request: JobRequest, channel: EventChannel):
+    "Downloads the repository and runs the tests, called by the job queue."
+    assignment, user = request.assignment, request.user
+
+    suite = test_case_finder.get_indexed_assignment(assignment)
+    if suite is None or len(suite.groups) == 0:
+        raise ValueError(f"Test suite {assignment} not found")
+
+    repo_path = repo_downloader.download(
+        f"{assignment}-{user}",
+        pull_if_exists=request.pull_if_exists,
+        sparse_paths=_sparse_paths(suite),
+        reference=assignment if settings.repository_reference else None,
+    )
+
+    commit = repo_downloader.head_commit(repo_path)
+    key = ResultKey(assignment, user, commit, suite.fingerprint, runner_key)
+    clean_run = request.clean_run
+    results = None if clean_run else result_store.get(key)
+    if results is not None:
+        logger.info(f"Reusing results of {assignment}/{user} at {commit}")
+    else:
+        _remember_digests(suite)
+        flight_key = (key, clean_run)
+        grading_events.subscribe(flight_key, channel)
+        try:
+            results = grading.run(
+                flight_key, lambda: _grade(key, clean_run, repo_path, suite)
+            )
+        finally:
+            grading_events.unsubscribe(flight_key, channel)
+
+    return results
+
+
+job_queue = JobQueue(
+    settings.queue_database,
+    _run_job,
+    workers=settings.queue_workers,
+    max_pending=settings.queue_size,
+    retention=settings.queue_retention,
+).start()
+
+
+@app.exception_handler(QueueFullException)
+def queue_full_handler(request: Request, exception: QueueFullException):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exception)},
+        headers={"Retry-After": str(exception.retry_after)},
+    )
+
+
+def _submit_job(request: JobRequest) -> Job:
+    if test_case_finder.get_assignment_path(request.assignment) is None:
+        raise HTTPException(status_code=404, detail="Test suite not found")
+    return job_queue.submit(request)
+
+
+@app.post(
+    "/assignments/{assignment}/{user}/jobs",
+    tags=["jobs"],
+    status_code=202,
+    responses={429: {"description": "Queue full, see Retry-After"}},
+)
+def submit_job(
     assignment: str,
     user: str,
-    clean_run: bool,
-    repo_path: Path,
-    assignment_groups: list[TestGroup],
-    callback_url: HttpUrl,
-) -> None:
-    results = _run_tests(assignment, user, clean_run, repo_path, assignment_groups)
-    final_callback_url = str(callback_url) + f"/{assignment}/{user}"
-    response = httpx.post(final_callback_url, content=results.model_dump_json())
-    logger.info(
-        f"Callback to {callback_url} returned {response.status_code}: {response.text}"
+    clean_run: bool = False,
+    pull_if_exists: bool = True,
+    callback_url: HttpUrl | None = None,
+) -> Job:
+    return _submit_job(
+        JobRequest(
+            assignment=assignment,
+            user=user,
+            clean_run=clean_run,
+            pull_if_exists=pull_if_exists,
+            callback_url=callback_url,
+        )
+    )
+
+
+@app.get("/jobs/{job_id}", tags=["jobs"])
+def get_job(job_id: str) -> Job:
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}/result", tags=["jobs"])
+def get_job_result(job_id: str) -> AssignmentResults:
+    job = get_job(job_id)
+    if job.status == JobStatus.failed:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != JobStatus.done:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value}")
+    return AssignmentResults.model_validate_json(job_queue.result(job_id) or "")
+
+
+def _iter_job_events(job_id: str) -> Iterable[Event]:
+    "Yields the status changes of the job, the events of its run, and its result."
+    job = job_queue.get(job_id)
+    status = None
+    while job is not None:
+        if job.status != status:
+            status = job.status
+            yield JobEvent(job=job)
+        if job.status in (JobStatus.done, JobStatus.failed):
+            break
+
+        channel = job_events.get(job_id)
+        if channel is not None:
+            yield from channel
+            job = job_queue.wait(job_id)
+        else:
+            # the channel is created when a worker takes the job
+            job = job_queue.wait(job_id, timeout=0.5)
+
+    if job is None:
+        return
+    if job.status == JobStatus.done:
+        result = job_queue.result(job_id) or ""
+        yield ResultEvent(results=AssignmentResults.model_validate_json(result))
+    else:
+        yield ErrorEvent(error=job.error or "")
+
+
+def _stream_events(events: Iterable[Event], format: Literal["sse", "ndjson"]):
+    if format == "sse":
+        return StreamingResponse(
+            (format_sse(event) for event in events),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+    return StreamingResponse(
+        (format_ndjson(event) for event in events),
+        media_type="application/x-ndjson",
     )
 
 
+event_stream_responses = {
+    200: {
+        "content": {"text/event-stream": {}, "application/x-ndjson": {}},
+        "description": "Events `job`, `group`, `test`, and `result` or `error`",
+    },
+}
+
+
+@app.get(
+    "/jobs/{job_id}/events",
+    tags=["jobs"],
+    response_class=StreamingResponse,
+    responses=event_stream_responses,
+)
+def get_job_events(job_id: str, format: Literal["sse", "ndjson"] = "sse"):
+    "Streams the results of the job as each group and test finishes."
+    get_job(job_id)
+    return _stream_events(_iter_job_events(job_id), format)
+
+
+@app.post(
+    "/assignments/{assignment}/{user}/events",
+    tags=["assignments"],
+    response_class=StreamingResponse,
+    responses={
+        **event_stream_responses,
+        429: {"description": "Queue full, see Retry-After"},
+    },
+)
+def run_tests_events(
+    assignment: str,
+    user: str,
+    clean_run: bool = False,
+    pull_if_exists: bool = True,
+    format: Literal["sse", "ndjson"] = "sse",
+):
+    "Runs the tests in the job queue, streaming the results as they finish."
+    job = submit_job(
+        assignment, user, clean_run=clean_run, pull_if_exists=pull_if_exists
+    )
+    return _stream_events(_iter_job_events(job.id), format)
+
+
 run_tests_callback_router = APIRouter()
 
 
@@ -132,37 +561,173 @@ def test_result():
     "/assignments/{assignment}/{user}",
     tags=["assignments"],
     callbacks=run_tests_callback_router.routes,
-    responses={200: {"model": AssignmentResults}, 202: {"model": CallbackResponse}},
+    responses={
+        200: {"model": AssignmentResults},
+        202: {
+            "model": CallbackResponse,
+            "description": "With `callback_url`, or when the job takes too long",
+        },
+        429: {"description": "Queue full, see Retry-After"},
+    },
 )
 def run_tests(
     assignment: str,
     user: str,
-    background_tasks: BackgroundTasks,
     clean_run: bool = False,
     pull_if_exists: bool = True,
     callback_url: HttpUrl | None = None,
 ) -> AssignmentResults | CallbackResponse:
-    assignment_groups = test_case_finder.get_assignment(assignment)
+    """
+    Runs the tests in the job queue, waiting for the results without `callback_url`.
+    If the job does not finish in `REQUEST_TIMEOUT` seconds, responds `202` with
+    the job, to get its results from `/jobs/{id}`.
+    """
+    job = submit_job(assignment, user, clean_run, pull_if_exists, callback_url)
+
+    if callback_url:
+        return CallbackResponse(user=user, assignment=assignment, job=job.id)
+
+    finished = job_queue.wait(job.id, timeout=settings.request_timeout)
+    if finished is not None and finished.status in (
+        JobStatus.queued,
+        JobStatus.running,
+    ):
+        return JSONResponse(
+            status_code=202,
+            content=CallbackResponse(
+                user=user, assignment=assignment, job=job.id
+            ).model_dump(),
+            headers={"Location": f"/jobs/{job.id}"},
+        )
+    return get_job_result(job.id)
 
-    if assignment_groups is None:
+
+class BulkRequest(BaseModel):
+    users: list[str] | None = Field(
+        default=None, description="Every repository of the assignment if not given"
+    )
+    clean_run: bool = False
+    pull_if_exists: bool = True
+    callback_url: HttpUrl | None = None
+    batch_size: int = Field(default=20, ge=1, description="Results per callback")
+
+
+class BulkJobs(BaseModel):
+    assignment: str
+    jobs: dict[str, str] = Field(description="Job of each user")
+
+
+class BulkResult(BaseModel):
+    user: str
+    job: str
+    status: JobStatus
+    results: AssignmentResults | None = None
+    error: str | None = None
+
+
+def _bulk_result(job: Job) -> BulkResult:
+    result = job_queue.result(job.id) if job.status == JobStatus.done else None
+    return BulkResult(
+        user=job.request.user,
+        job=job.id,
+        status=job.status,
+        results=(
+            None if result is None else AssignmentResults.model_validate_json(result)
+        ),
+        error=job.error,
+    )
+
+
+def _post_bulk_results(
+    assignment: str, jobs: list[Job], callback_url: HttpUrl, batch_size: int
+):
+    "Posts the results in batches of `batch_size` as the jobs finish."
+    final_callback_url = str(callback_url) + f"/{assignment}"
+    batch: list[BulkResult] = []
+    for i, job in enumerate(job_queue.iter_finished([j.id for j in jobs]), 1):
+        batch.append(_bulk_result(job))
+        if len(batch) < batch_size and i < len(jobs):
+            continue
+
+        content = json.dumps([result.model_dump(mode="json") for result in batch])
+        batch = []
+        try:
+            response = httpx.post(final_callback_url, content=content)
+            logger.info(
+                f"Callback to {final_callback_url} returned {response.status_code}"
+            )
+        except httpx.HTTPError:
+            logger.exception(f"Callback to {final_callback_url} failed")
+
+
+run_tests_bulk_callback_router = APIRouter()
+
+
+@run_tests_bulk_callback_router.post(
+    "{$callback_url}/{$request.path.assignment}", status_code=200
+)
+def test_bulk_results(results: list[BulkResult]):
+    "Callback called by the server with a batch of finished users."
+
+
+@app.post(
+    "/assignments/{assignment}",
+    tags=["assignments"],
+    callbacks=run_tests_bulk_callback_router.routes,
+    response_model=None,
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "description": "A `BulkResult` per line, as the users finish",
+        },
+        202: {"model": BulkJobs},
+        429: {"description": "Queue full, see Retry-After"},
+    },
+)
+def run_tests_bulk(assignment: str, request: BulkRequest):
+    """
+    Runs the tests of many users in the job queue, streaming their results or
+    posting them to `callback_url` in batches.
+    """
+    if test_case_finder.get_assignment_path(assignment) is None:
         raise HTTPException(status_code=404, detail="Test suite not found")
 
-    try:
-        repo = f"{assignment}-{user}"
-        repo_path = repo_downloader.download(repo, pull_if_exists=pull_if_exists)
-    except RepositoryDownloadException:
-        raise HTTPException(status_code=500, detail="Failed to download repository")
+    users = request.users
+    if users is None:
+        prefix = f"{assignment}-"
+        try:
+            repos = repo_downloader.list_repositories(prefix)
+        except RepositoryDownloadException:
+            raise HTTPException(status_code=500, detail="Failed to list repositories")
+        users = [repo.removeprefix(prefix) for repo in repos]
+
+    jobs = job_queue.submit_many(
+        [
+            JobRequest(
+                assignment=assignment,
+                user=user,
+                clean_run=request.clean_run,
+                pull_if_exists=request.pull_if_exists,
+            )
+            for user in dict.fromkeys(users)
+        ]
+    )
 
-    if callback_url:
-        background_tasks.add_task(
-            _run_tests_tasks,
-            assignment,
-            user,
-            clean_run,
-            repo_path,
-            assignment_groups,
-            callback_url,
+    if request.callback_url:
+        Thread(
+            target=_post_bulk_results,
+            args=(assignment, jobs, request.callback_url, request.batch_size),
+            daemon=True,
+            name=f"bulk-callback-{assignment}",
+        ).start()
+        jobs_by_user = {job.request.user: job.id for job in jobs}
+        return JSONResponse(
+            status_code=202,
+            content=BulkJobs(assignment=assignment, jobs=jobs_by_user).model_dump(),
         )
-        return CallbackResponse(user=user, assignment=assignment)
 
-    return _run_tests(assignment, user, clean_run, repo_path, assignment_groups)
+    def stream_results():
+        for job in job_queue.iter_finished([job.id for job in jobs]):
+            yield _bulk_result(job).model_dump_json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
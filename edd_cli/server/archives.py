@@ -0,0 +1,105 @@
+import math
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from string import hexdigits
+from threading import get_ident
+from time import time
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from ..finder import IndexedAssignment, is_manifest_file
+from ..utils.dir import dir_files
+from ..utils.single_flight import SingleFlight
+
+logger = getLogger(__name__)
+
+
+class SuiteArchives:
+    """
+    Zip files of the test suites, built once per suite fingerprint in `directory`
+    and replaced atomically. Archives are built by a background thread, and the
+    requests of an archive being built wait for that build.
+    The mtime of an archive is the time its version of the suite was published, in
+    whole seconds and always after the previous version, so it works as
+    `Last-Modified` even when files are replaced by older ones. Archives of previous
+    versions are kept for `keep_old` seconds after being replaced, for the downloads
+    already serving them, and removed by a later build.
+    """
+
+    def __init__(self, directory: Path, *, workers: int = 1, keep_old: float = 60):
+        self.directory = directory
+        self.keep_old = keep_old
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="archive")
+        self._builds: SingleFlight[Path] = SingleFlight()
+
+    def path(self, suite: IndexedAssignment):
+        return self.directory / f"{suite.path.name}-{suite.fingerprint}.zip"
+
+    def get(self, suite: IndexedAssignment) -> Future[Path]:
+        "Returns the future path of the archive of the suite, building it if missing."
+        path = self.path(suite)
+        if path.is_file():
+            archives = self._archives(suite)
+            if archives and archives[-1][1] != path:
+                # the suite went back to a previous version, published again
+                modified = self._next_mtime(archives)
+                os.utime(path, (modified, modified))
+            built: Future[Path] = Future()
+            built.set_result(path)
+            return built
+        return self._builds.submit(
+            path, lambda: self._build(suite, path), self._executor
+        )
+
+    def _build(self, suite: IndexedAssignment, path: Path):
+        "Writes the files of the suite, publishing the archive as its newest version."
+        if suite.manifest is not None:
+            files = [(file.path, file.mtime_ns) for file in suite.manifest.files]
+        else:
+            files = [
+                (file, stat.st_mtime_ns)
+                for file, stat in dir_files(suite.path, exclude=is_manifest_file)
+            ]
+
+        logger.info(f"Building archive of {suite.path.name} with {len(files)} files")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}-{get_ident()}.tmp")
+        try:
+            with ZipFile(temp_path, "w", ZIP_DEFLATED) as zipf:
+                for file, _ in files:
+                    zipf.write(suite.path / file, file)
+            modified = self._next_mtime(self._archives(suite))
+            os.utime(temp_path, (modified, modified))
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+        self._remove_old(suite, path)
+        return path
+
+    def _remove_old(self, suite: IndexedAssignment, path: Path):
+        "Removes the archives replaced by a newer one more than `keep_old` ago."
+        archives = self._archives(suite)
+        for (_, old), (replaced_at, _) in zip(archives, archives[1:]):
+            if old != path and time() - replaced_at > self.keep_old:
+                old.unlink(missing_ok=True)
+
+    def _archives(self, suite: IndexedAssignment):
+        "Returns the mtime and path of every archive of the suite, the oldest first."
+        prefix = f"{suite.path.name}-"
+        archives: list[tuple[float, Path]] = []
+        for archive in self.directory.glob(f"{prefix}*.zip"):
+            fingerprint = archive.stem.removeprefix(prefix)
+            if len(fingerprint) != 64 or not all(c in hexdigits for c in fingerprint):
+                continue
+            try:
+                archives.append((archive.stat().st_mtime, archive))
+            except FileNotFoundError:
+                continue
+        return sorted(archives)
+
+    def _next_mtime(self, archives: list[tuple[float, Path]]):
+        "Returns the current time, in seconds after the newest of the `archives`."
+        newest = archives[-1][0] if archives else 0
+        return max(math.ceil(time()), math.floor(newest) + 1)
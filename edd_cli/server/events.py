@@ -0,0 +1,119 @@
+from collections import defaultdict
+from threading import Condition, Lock
+from typing import Hashable, Literal
+
+from pydantic import BaseModel, Field
+
+from ..schema.results import AssignmentResults, TestErrorResult, TestOkResult
+from .jobs import Job
+
+
+class JobEvent(BaseModel):
+    event: Literal["job"] = "job"
+    job: Job
+
+
+class GroupEvent(BaseModel):
+    "A group finished its stages, its tests are reported by `TestEvent`."
+
+    event: Literal["group"] = "group"
+    name: str
+    verdict: Literal["ok", "error"]
+    error: str | None = None
+
+
+class TestEvent(BaseModel):
+    event: Literal["test"] = "test"
+    group: str
+    result: TestOkResult | TestErrorResult = Field(discriminator="verdict")
+
+
+class ResultEvent(BaseModel):
+    event: Literal["result"] = "result"
+    results: AssignmentResults
+
+
+class ErrorEvent(BaseModel):
+    event: Literal["error"] = "error"
+    error: str
+
+
+Event = JobEvent | GroupEvent | TestEvent | ResultEvent | ErrorEvent
+
+
+def format_sse(event: Event) -> str:
+    "Formats the event as a Server-Sent Event."
+    return f"event: {event.event}\ndata: {event.model_dump_json()}\n\n"
+
+
+def format_ndjson(event: Event) -> str:
+    return event.model_dump_json() + "\n"
+
+
+class EventChannel:
+    "Events of a job. Every subscriber gets them from the first one until closed."
+
+    def __init__(self):
+        self._condition = Condition()
+        self._events: list[Event] = []
+        self._closed = False
+
+    def publish(self, event: Event):
+        with self._condition:
+            self._events.append(event)
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __iter__(self):
+        sent = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._events) > sent or self._closed
+                )
+                events = self._events[sent:]
+                closed = self._closed
+            sent += len(events)
+            yield from events
+            if closed and not events:
+                return
+
+
+class EventHub:
+    """
+    Publishes the events of a run to the channels subscribed to its key, like
+    the jobs coalesced into one grading. Late subscribers get the past events
+    of the run first.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._channels: dict[Hashable, list[EventChannel]] = defaultdict(list)
+        self._history: dict[Hashable, list[Event]] = defaultdict(list)
+
+    def subscribe(self, key: Hashable, channel: EventChannel):
+        with self._lock:
+            for event in self._history.get(key, []):
+                channel.publish(event)
+            self._channels[key].append(channel)
+
+    def unsubscribe(self, key: Hashable, channel: EventChannel):
+        with self._lock:
+            self._channels[key].remove(channel)
+            if not self._channels[key]:
+                del self._channels[key]
+
+    def publish(self, key: Hashable, event: Event):
+        with self._lock:
+            self._history[key].append(event)
+            for channel in self._channels.get(key, []):
+                channel.publish(event)
+
+    def end(self, key: Hashable):
+        "Called when the run finishes, so the next run of the key starts empty."
+        with self._lock:
+            self._history.pop(key, None)
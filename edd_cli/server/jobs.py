@@ -0,0 +1,283 @@
+import json
+import sqlite3
+from datetime import datetime
+from enum import Enum
+from logging import getLogger
+from math import ceil
+from pathlib import Path
+from threading import Condition, Thread
+from time import time
+from typing import Callable
+from uuid import uuid4
+
+from pydantic import BaseModel, Field, HttpUrl
+
+logger = getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    request TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT,
+    callback_error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+
+COLUMNS = "id, request, status, created, started, finished, error, callback_error"
+
+# Used to estimate the wait when no job has finished yet
+DEFAULT_JOB_DURATION = 30
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class JobRequest(BaseModel):
+    assignment: str
+    user: str
+    clean_run: bool = False
+    pull_if_exists: bool = True
+    callback_url: HttpUrl | None = None
+
+
+class Job(BaseModel):
+    id: str
+    request: JobRequest
+    status: JobStatus
+    created: datetime
+    started: datetime | None = None
+    finished: datetime | None = None
+    error: str | None = None
+    callback_error: str | None = Field(
+        default=None, description="Why the results could not be sent to the callback"
+    )
+
+
+class QueueFullException(Exception):
+    "Raised when the queue has too many pending jobs."
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    Queue of grading jobs run by a pool of `workers` threads with `handler`,
+    called with the id and request of the job.
+    Jobs and their results are stored in SQLite, so queued jobs survive restarts
+    (jobs that were running are queued again). Accepts up to `max_pending` queued
+    jobs, and finished jobs are kept for `retention` seconds.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        handler: Callable[[str, JobRequest], BaseModel],
+        *,
+        workers: int = 2,
+        max_pending: int = 100,
+        retention: float = 24 * 3600,
+    ):
+        self._handler = handler
+        self._workers = workers
+        self._max_pending = max_pending
+        self._retention = retention
+        self._condition = Condition()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._condition, self._connection as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if "callback_error" not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN callback_error TEXT")
+            connection.execute(
+                "UPDATE jobs SET status = ?, started = NULL WHERE status = ?",
+                (JobStatus.queued, JobStatus.running),
+            )
+
+    def start(self):
+        for i in range(self._workers):
+            Thread(target=self._work, daemon=True, name=f"job-worker-{i}").start()
+        return self
+
+    def submit(self, request: JobRequest) -> Job:
+        """
+        Queues the job, raises `QueueFullException` if there are too many pending.
+        Returns the queued job with the same request if there is one.
+        """
+        return self.submit_many([request])[0]
+
+    def submit_many(self, requests: list[JobRequest]) -> list[Job]:
+        """
+        Queues every job, like `submit`. The jobs are accepted together if the
+        queue is not full, even if they go over `max_pending`.
+        """
+        with self._condition:
+            if self._count(JobStatus.queued) >= self._max_pending:
+                raise QueueFullException(self._retry_after())
+            with self._connection as connection:
+                jobs = [self._insert(connection, request) for request in requests]
+            self._condition.notify_all()
+        return jobs
+
+    def iter_finished(self, job_ids: list[str]):
+        "Yields the jobs as they finish, in any order."
+        pending = set(job_ids)
+        while pending:
+            with self._condition:
+                while not (finished := self._finished(pending)) and pending:
+                    self._condition.wait()
+            for job in finished:
+                pending.discard(job.id)
+                yield job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._condition:
+            row = self._connection.execute(
+                f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else self._to_job(row)
+
+    def result(self, job_id: str) -> str | None:
+        "Returns the JSON result of a finished job."
+        with self._condition:
+            row = self._connection.execute(
+                "SELECT result FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_callback_error(self, job_id: str, error: str):
+        "Records that the results of a job could not be sent, keeping its status."
+        with self._condition, self._connection as connection:
+            connection.execute(
+                "UPDATE jobs SET callback_error = ? WHERE id = ?", (error, job_id)
+            )
+
+    def wait(self, job_id: str, timeout: float | None = None) -> Job | None:
+        "Waits until the job finishes, returns it as it is after `timeout` seconds."
+        with self._condition:
+            self._condition.wait_for(
+                lambda: (job := self.get(job_id)) is None
+                or job.status in (JobStatus.done, JobStatus.failed),
+                timeout,
+            )
+        return self.get(job_id)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while (claimed := self._claim()) is None:
+                    self._condition.wait()
+            job_id, request = claimed
+
+            logger.info(f"Running job {job_id}: {request.assignment}/{request.user}")
+            try:
+                result = self._handler(job_id, request).model_dump_json()
+                self._finish(job_id, JobStatus.done, result=result)
+            except Exception as error:
+                logger.exception(f"Job {job_id} failed")
+                self._finish(job_id, JobStatus.failed, error=str(error))
+
+    def _insert(self, connection: sqlite3.Connection, request: JobRequest) -> Job:
+        queued = connection.execute(
+            f"SELECT {COLUMNS} FROM jobs WHERE status = ? AND request = ?",
+            (JobStatus.queued, request.model_dump_json()),
+        ).fetchone()
+        if queued is not None:
+            return self._to_job(queued)
+
+        now = time()
+        job = Job(
+            id=uuid4().hex,
+            request=request,
+            status=JobStatus.queued,
+            created=datetime.fromtimestamp(now),
+        )
+        connection.execute(
+            "INSERT INTO jobs (id, request, status, created) VALUES (?, ?, ?, ?)",
+            (job.id, request.model_dump_json(), job.status, now),
+        )
+        return job
+
+    def _finished(self, job_ids: set[str]) -> list[Job]:
+        "Returns the finished jobs, discarding the removed ones from `job_ids`."
+        rows = self._connection.execute(
+            f"SELECT {COLUMNS} FROM jobs WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(job_ids)),),
+        ).fetchall()
+        jobs = [self._to_job(row) for row in rows]
+        job_ids &= {job.id for job in jobs}
+        return [job for job in jobs if job.status in (JobStatus.done, JobStatus.failed)]
+
+    def _claim(self):
+        with self._connection as connection:
+            row = connection.execute(
+                "UPDATE jobs SET status = ?, started = ? WHERE id = ("
+                " SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1"
+                ") RETURNING id, request",
+                (JobStatus.running, time(), JobStatus.queued),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, request = row
+        return job_id, JobRequest.model_validate_json(request)
+
+    def _finish(self, job_id: str, status: JobStatus, *, result=None, error=None):
+        with self._condition:
+            with self._connection as connection:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, finished = ?, result = ?, error = ?"
+                    " WHERE id = ?",
+                    (status, time(), result, error, job_id),
+                )
+                connection.execute(
+                    "DELETE FROM jobs WHERE finished < ?", (time() - self._retention,)
+                )
+            self._condition.notify_all()
+
+    def _count(self, status: JobStatus) -> int:
+        return self._connection.execute(
+            "SELECT count(*) FROM jobs WHERE status = ?", (status,)
+        ).fetchone()[0]
+
+    def _retry_after(self) -> int:
+        "Estimates the seconds until a worker is free, from recent durations."
+        (duration,) = self._connection.execute(
+            "SELECT avg(finished - started) FROM ("
+            " SELECT finished, started FROM jobs WHERE status = ?"
+            " ORDER BY finished DESC LIMIT 20"
+            ")",
+            (JobStatus.done,),
+        ).fetchone()
+        duration = duration or DEFAULT_JOB_DURATION
+        return max(1, ceil(duration / self._workers))
+
+    def _to_job(self, row) -> Job:
+        id, request, status, created, started, finished, error, callback_error = row
+        return Job(
+            id=id,
+            request=JobRequest.model_validate_json(request),
+            status=status,
+            created=datetime.fromtimestamp(created),
+            started=_from_timestamp(started),
+            finished=_from_timestamp(finished),
+            error=error,
+            callback_error=callback_error,
+        )
+
+
+def _from_timestamp(timestamp: float | None):
+    return None if timestamp is None else datetime.fromtimestamp(timestamp)
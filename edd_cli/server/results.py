@@ -0,0 +1,124 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import NamedTuple
+
+from pydantic import BaseModel
+
+from ..schema.results import AssignmentResults
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    assignment TEXT NOT NULL,
+    user TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    suite TEXT NOT NULL,
+    runner TEXT NOT NULL,
+    created REAL NOT NULL,
+    results TEXT NOT NULL,
+    expires REAL,
+    PRIMARY KEY (assignment, user, commit_sha, suite, runner)
+);
+CREATE INDEX IF NOT EXISTS results_latest ON results (assignment, user, created);
+"""
+
+COLUMNS = "assignment, user, commit_sha, suite, runner, created, results"
+
+
+class ResultKey(NamedTuple):
+    "What the results depend on: the repository commit, test suite and runner."
+
+    assignment: str
+    user: str
+    commit: str
+    suite: str
+    runner: str
+
+
+class StoredResults(BaseModel):
+    assignment: str
+    user: str
+    commit: str
+    suite: str
+    runner: str
+    created: datetime
+    results: AssignmentResults
+
+
+class ResultStore:
+    """
+    SQLite store of the results of every graded commit, by `ResultKey`.
+    Results saved with `reuse_for` are not returned by `get` after those seconds,
+    but are still listed.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            columns = [
+                row[1] for row in connection.execute("PRAGMA table_info(results)")
+            ]
+            if "expires" not in columns:
+                connection.execute("ALTER TABLE results ADD COLUMN expires REAL")
+
+    def get(self, key: ResultKey) -> AssignmentResults | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT results FROM results WHERE assignment = ? AND user = ?"
+                " AND commit_sha = ? AND suite = ? AND runner = ?"
+                " AND (expires IS NULL OR expires > ?)",
+                (*key, time()),
+            ).fetchone()
+        return None if row is None else AssignmentResults.model_validate_json(row[0])
+
+    def save(
+        self, key: ResultKey, results: AssignmentResults, reuse_for: float | None = None
+    ):
+        now = time()
+        expires = None if reuse_for is None else now + reuse_for
+        with self._lock, self._connection as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO results ({COLUMNS}, expires)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, now, results.model_dump_json(), expires),
+            )
+
+    def latest(self, assignment: str) -> list[StoredResults]:
+        "Returns the last results of every user of the assignment."
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {COLUMNS} FROM results AS r WHERE assignment = ? AND created = ("
+                " SELECT max(created) FROM results"
+                " WHERE assignment = r.assignment AND user = r.user"
+                ") ORDER BY user",
+                (assignment,),
+            ).fetchall()
+        return [self._to_stored(row) for row in rows]
+
+    def history(self, assignment: str, user: str, limit: int) -> list[StoredResults]:
+        "Returns the results of the user, the newest first."
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {COLUMNS} FROM results WHERE assignment = ? AND user = ?"
+                " ORDER BY created DESC LIMIT ?",
+                (assignment, user, limit),
+            ).fetchall()
+        return [self._to_stored(row) for row in rows]
+
+    def _to_stored(self, row) -> StoredResults:
+        assignment, user, commit, suite, runner, created, results = row
+        return StoredResults(
+            assignment=assignment,
+            user=user,
+            commit=commit,
+            suite=suite,
+            runner=runner,
+            created=datetime.fromtimestamp(created),
+            results=AssignmentResults.model_validate_json(results),
+        )
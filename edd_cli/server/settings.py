@@ -5,6 +5,9 @@ from tempfile import gettempdir
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+from ..repository import FetchMode
+from ..runner import RunnerKind
+
 logger = getLogger(__name__)
 
 temp_dir = Path(gettempdir())
@@ -22,10 +25,37 @@ def create_secret():
 class ServerSettings(BaseSettings):
     github_org: str = "IIC2133-PUC"
     repository_download_dir: Path = Path(temp_dir, ".edd-repos")
+    repository_remote: str | None = Field(
+        default=None, description="Git URL with {org} and {repo}, instead of gh"
+    )
+    repository_fetch: FetchMode = FetchMode.full
+    repository_sparse_checkout: bool = False
+    repository_reference: bool = False
     output_temp_dir: Path = Path(temp_dir, ".edd-cache")
+    shared_cache: bool = False
+    link_include_files: bool = False
+    deduplicate_cache: bool = False
+    output_cache_budget: int | None = Field(default=None, description="Bytes")
+    repository_cache_budget: int | None = Field(default=None, description="Bytes")
+    cache_reconcile_interval: float = Field(default=6 * 3600, description="Seconds")
     tests_directory: Path = Path("tests")
+    tests_refresh_interval: float = Field(default=2, description="Seconds")
+    tests_archive_dir: Path = Path(temp_dir, ".edd-archives")
     secret: str = Field(default_factory=create_secret)
     docker_image: str = "edd-runner"
+    runner: RunnerKind = RunnerKind.docker
+    jobs: int = Field(default=1, ge=1)
+    results_database: Path = Path(temp_dir, ".edd-results.sqlite3")
+    errored_results_reuse: float = Field(
+        default=600, description="Seconds results with errors are reused"
+    )
+    queue_database: Path = Path(temp_dir, ".edd-jobs.sqlite3")
+    queue_workers: int = Field(default=2, ge=1)
+    queue_size: int = Field(default=100, ge=1)
+    queue_retention: float = Field(default=24 * 3600, description="Seconds")
+    request_timeout: float = Field(
+        default=300, description="Seconds a request waits for its job"
+    )
 
 
 settings = ServerSettings()
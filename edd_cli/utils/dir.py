@@ -1,7 +1,10 @@
+import hashlib
+import os
 import shutil
 from datetime import datetime, timedelta
 from logging import getLogger
 from pathlib import Path
+from typing import Callable
 
 logger = getLogger(__name__)
 
@@ -22,15 +25,29 @@ def dir_last_modified(dir: Path) -> datetime:
     )
 
 
-def dir_size(dir: Path) -> int:
-    "Returns the size of the directory in bytes."
-    return sum(f.stat().st_size for f in dir.glob("**/*") if f.is_file())
+def dir_size(dir: Path, *, skip_linked: bool = False) -> int:
+    """
+    Returns the size of the directory in bytes, counting hardlinked files once.
+    With `skip_linked`, files with links outside the directory are not counted.
+    """
+    seen: set[tuple[int, int]] = set()
+    size = 0
+    for file in dir.glob("**/*"):
+        if not file.is_file():
+            continue
+        stat = file.stat()
+        if skip_linked and stat.st_nlink > 1:
+            continue
+        if (stat.st_dev, stat.st_ino) not in seen:
+            seen.add((stat.st_dev, stat.st_ino))
+            size += stat.st_size
+    return size
 
 
 def dir_clear_old(dir: Path, min_age: timedelta):
     "Clears sub-directories older than `min_age` seconds in the given directory."
     for subdir in dir.glob("*"):
-        if not subdir.is_dir():
+        if not subdir.is_dir() or subdir.name.startswith("."):
             continue
 
         age = datetime.now() - dir_last_use(subdir)
@@ -38,3 +55,48 @@ def dir_clear_old(dir: Path, min_age: timedelta):
         if min_age < age:
             logger.info(f"Removing {subdir} (last used {age} ago)")
             shutil.rmtree(subdir)
+
+
+def dir_files(dir: Path, exclude: Callable[[str], bool] | None = None):
+    """
+    Returns the relative path and stat of every file, sorted by path, without the
+    paths for which `exclude` is true.
+    """
+    files = _walk_files(dir, "")
+    return sorted(file for file in files if exclude is None or not exclude(file[0]))
+
+
+def files_signature(files: list[tuple[str, os.stat_result]]) -> tuple[str, datetime]:
+    """
+    Returns a hash of the paths, sizes and modification times of the files, that
+    changes when any file is added, removed or modified, and the last time a file
+    was used.
+    """
+    fingerprint = hashlib.sha256()
+    last_use = 0.0
+    for path, stat in files:
+        fingerprint.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        last_use = max(last_use, stat.st_atime)
+    return fingerprint.hexdigest(), datetime.fromtimestamp(last_use)
+
+
+def dir_signature(
+    dir: Path, exclude: Callable[[str], bool] | None = None
+) -> tuple[str, datetime]:
+    "Returns the `files_signature` of the directory, without the `exclude` paths."
+    return files_signature(dir_files(dir, exclude))
+
+
+def _walk_files(dir: Path | str, prefix: str):
+    "Yields the relative path and stat of every file, reusing the `scandir` stats."
+    with os.scandir(dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, f"{prefix}{entry.name}/")
+            elif entry.is_file():
+                yield f"{prefix}{entry.name}", entry.stat()
+
+
+def dir_fingerprint(dir: Path) -> str:
+    "Returns a hash that changes when any file of the directory changes."
+    return dir_signature(dir)[0]
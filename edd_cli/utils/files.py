@@ -0,0 +1,47 @@
+import os
+import shutil
+import stat
+from logging import getLogger
+from pathlib import Path
+
+try:
+    from fcntl import ioctl
+except ImportError:  # not available on Windows
+    ioctl = None
+
+logger = getLogger(__name__)
+
+FICLONE = 0x40049409
+
+WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+
+def reflink_or_copy(source: Path, target: Path):
+    """
+    Copies the file with copy-on-write (reflink) when the filesystem supports it,
+    like btrfs or xfs, falling back to a regular copy. Keeps the file mode, but the
+    copy is always writable by its owner.
+    """
+    copied = False
+    if ioctl is not None:
+        try:
+            with source.open("rb") as src, target.open("wb") as dst:
+                ioctl(dst.fileno(), FICLONE, src.fileno())
+            copied = True
+        except OSError:
+            pass
+    if not copied:
+        shutil.copyfile(source, target)
+    target.chmod(stat.S_IMODE(source.stat().st_mode) | stat.S_IWUSR)
+
+
+def link_or_copy(source: Path, target: Path):
+    """
+    Hardlinks the file, so writing the target writes the source too.
+    Falls back to `reflink_or_copy` across filesystems.
+    """
+    try:
+        os.link(source, target)
+    except OSError as error:
+        logger.debug(f"Can't link {source} ({error}), copying it")
+        reflink_or_copy(source, target)
@@ -3,7 +3,7 @@ from typing import IO, TYPE_CHECKING, Callable
 if TYPE_CHECKING:
     from hashlib import _Hash
 
-file_digest: "Callable[[IO, Callable[[], _Hash]], None]"
+file_digest: "Callable[[IO, Callable[[], _Hash]], _Hash]"
 
 try:
     from hashlib import file_digest  # type: ignore
@@ -17,3 +17,4 @@ except ImportError:
             if not chunk:
                 break
             hash_func.update(chunk)
+        return hash_func
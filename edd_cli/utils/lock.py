@@ -0,0 +1,51 @@
+import os
+from pathlib import Path
+
+try:
+    from fcntl import LOCK_EX, flock
+except ImportError:  # not available on Windows
+    flock = None
+
+
+class FileLock:
+    """
+    Exclusive lock shared by threads and processes, held with `flock` on a lock
+    file. The lock file is removed on release, and `acquire` retries when the file
+    it locked was removed meanwhile. The lock is released if the process dies.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: int | None = None
+
+    def acquire(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+            if flock is None:
+                break
+            flock(fd, LOCK_EX)
+            try:
+                if os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            # released and removed by its previous holder
+            os.close(fd)
+        self._fd = fd
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            self.path.unlink(missing_ok=True)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
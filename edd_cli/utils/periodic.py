@@ -0,0 +1,22 @@
+from logging import getLogger
+from threading import Thread
+from time import sleep
+from typing import Callable
+
+logger = getLogger(__name__)
+
+
+def run_periodically(function: Callable[[], object], interval: float, name: str):
+    "Runs `function` now and then every `interval` seconds in a daemon thread."
+
+    def loop():
+        while True:
+            try:
+                function()
+            except Exception:
+                logger.exception(f"Periodic task {name} failed")
+            sleep(interval)
+
+    thread = Thread(target=loop, daemon=True, name=name)
+    thread.start()
+    return thread
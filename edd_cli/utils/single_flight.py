@@ -0,0 +1,55 @@
+from concurrent.futures import Executor, Future
+from threading import Lock
+from typing import Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Runs at most one call per key at a time. Callers with the key of a call in
+    flight wait for it and get its result (or exception) instead of calling again.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: dict[Hashable, Future[T]] = {}
+
+    def run(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = function()
+            call.set_result(result)
+            return result
+        except BaseException as error:
+            call.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def submit(
+        self, key: Hashable, function: Callable[[], T], executor: Executor
+    ) -> Future[T]:
+        "Like `run`, but calls `function` in `executor`, returning the call future."
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call
+            call = self._calls[key] = executor.submit(function)
+
+        call.add_done_callback(lambda _: self._forget(key, call))
+        return call
+
+    def _forget(self, key: Hashable, call: Future[T]):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
@@ -0,0 +1,179 @@
+import subprocess
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from edd_cli.repository import (
+    FetchMode,
+    RepositoryDownloader,
+    RepositoryDownloadException,
+)
+
+ORG = "org"
+
+
+def git(cwd: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+class RepositoryDownloaderTest(unittest.TestCase):
+    "Downloads from a local bare repository with two commits."
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = Path(temp_dir.name)
+
+        self.work = self.root / "work"
+        self.work.mkdir()
+        git(self.work, "init", "--quiet", "--initial-branch=main")
+        git(self.work, "config", "user.name", "Test")
+        git(self.work, "config", "user.email", "test@example.com")
+        self.commit({"src/main.c": "int main;\n", "docs/readme.md": "docs\n"})
+        self.commit({"src/main.c": "int main(void) { return 0; }\n"})
+
+        self.remote = self.root / "remote" / ORG / "repo.git"
+        self.remote.parent.mkdir(parents=True)
+        git(self.root, "clone", "--quiet", "--bare", str(self.work), str(self.remote))
+        git(self.remote, "config", "uploadpack.allowFilter", "true")
+
+    def commit(self, files: dict[str, str]):
+        for name, content in files.items():
+            path = self.work / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+        git(self.work, "add", ".")
+        git(self.work, "commit", "--quiet", "--message", "commit")
+
+    def push(self):
+        git(self.work, "push", "--quiet", "--force", str(self.remote), "main")
+
+    def downloader(self, fetch: FetchMode = FetchMode.full):
+        return RepositoryDownloader(
+            ORG,
+            self.root / "downloads",
+            remote=f"file://{self.root}/remote/{{org}}/{{repo}}.git",
+            fetch=fetch,
+        )
+
+    def commits(self, path: Path):
+        return int(git(path, "rev-list", "--count", "HEAD"))
+
+    def test_full_fetch_has_the_history(self):
+        path = self.downloader().download("repo")
+        self.assertEqual(self.commits(path), 2)
+        self.assertEqual(
+            git(path, "rev-parse", "HEAD"), git(self.work, "rev-parse", "HEAD")
+        )
+
+    def test_shallow_fetch_has_the_last_commit(self):
+        downloader = self.downloader(FetchMode.shallow)
+        path = downloader.download("repo")
+        self.assertTrue((path / ".git" / "shallow").exists())
+        self.assertEqual(self.commits(path), 1)
+
+        self.commit({"src/main.c": "int main(void) { return 1; }\n"})
+        self.push()
+        downloader.download("repo")
+        self.assertEqual(
+            git(path, "rev-parse", "HEAD"), git(self.work, "rev-parse", "HEAD")
+        )
+        self.assertIn("return 1", (path / "src" / "main.c").read_text())
+
+    def test_partial_fetch_has_the_history_without_blobs(self):
+        path = self.downloader(FetchMode.partial).download("repo")
+        self.assertEqual(git(path, "config", "remote.origin.promisor"), "true")
+        self.assertEqual(
+            git(path, "config", "remote.origin.partialclonefilter"), "blob:none"
+        )
+        self.assertEqual(self.commits(path), 2)
+        self.assertTrue((path / "docs" / "readme.md").is_file())
+
+    def test_sparse_paths_check_out_only_matching_files(self):
+        downloader = self.downloader(FetchMode.partial)
+        path = downloader.download("repo", sparse_paths=["src/*.c"])
+        self.assertTrue((path / "src" / "main.c").is_file())
+        self.assertFalse((path / "docs").exists())
+
+        downloader.download("repo", pull_if_exists=False)
+        self.assertTrue((path / "docs" / "readme.md").is_file())
+
+    def test_update_after_a_rewritten_history(self):
+        downloader = self.downloader()
+        path = downloader.download("repo")
+        git(self.work, "reset", "--quiet", "--hard", "HEAD~1")
+        self.commit({"other.txt": "rewritten\n"})
+        self.push()
+
+        downloader.download("repo")
+        self.assertEqual(
+            git(path, "rev-parse", "HEAD"), git(self.work, "rev-parse", "HEAD")
+        )
+        self.assertTrue((path / "other.txt").is_file())
+
+    def test_download_many_clones_at_most_max_workers_at_once(self):
+        names = [f"repo-{i}" for i in range(6)]
+        for name in names:
+            remote = self.remote.with_name(f"{name}.git")
+            git(self.root, "clone", "--quiet", "--bare", str(self.work), str(remote))
+
+        downloader = self.downloader()
+        running, peak = 0, 0
+        lock = threading.Lock()
+        download = downloader._download
+
+        def counted_download(*args):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            try:
+                return download(*args)
+            finally:
+                with lock:
+                    running -= 1
+
+        downloader._download = counted_download
+        results = downloader.download_many(names + ["missing"], max_workers=2)
+
+        self.assertLessEqual(peak, 2)
+        self.assertIsInstance(results["missing"], RepositoryDownloadException)
+        for name in names:
+            self.assertEqual(self.commits(results[name]), 2)
+
+    def test_list_repositories_of_a_local_remote(self):
+        for name in ["repo-a", "other"]:
+            remote = self.remote.with_name(f"{name}.git")
+            git(self.root, "clone", "--quiet", "--bare", str(self.work), str(remote))
+
+        repos = self.downloader().list_repositories("repo")
+        self.assertEqual(repos, ["repo", "repo-a"])
+
+    def test_list_repositories_of_other_remotes_fails(self):
+        downloader = RepositoryDownloader(
+            ORG, self.root / "downloads", remote="https://example.com/{org}/{repo}"
+        )
+        with self.assertRaises(RepositoryDownloadException):
+            downloader.list_repositories("repo")
+
+    def test_concurrent_downloads_with_different_options(self):
+        downloader = self.downloader()
+        options = [
+            {"pull_if_exists": i % 2 == 0, "sparse_paths": ["src/"] if i % 3 else None}
+            for i in range(8)
+        ]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [
+                executor.submit(downloader.download, "repo", **kwargs)
+                for kwargs in options
+            ]
+        paths = {future.result() for future in futures}
+        self.assertEqual(len(paths), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from edd_cli.runner.runners import DirectRunner, RunErrorException
+from edd_cli.runner.runners.usage import read_usage
+
+MB = 1024 * 1024
+
+
+class DirectRunnerUsageTest(unittest.TestCase):
+    "Measures commands run by the direct runner, with `max_rss` in KiB."
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = Path(temp_dir.name) / "stage"
+        self.dir.mkdir()
+
+    def run_command(self, *command: str, timeout=10):
+        DirectRunner().run(list(command), self.dir, timeout=timeout)
+        usage = read_usage(self.dir)
+        assert usage is not None
+        return usage
+
+    def test_peak_excludes_the_runner_memory(self):
+        allocation = bytearray(b"\1") * (400 * MB)
+        usage = self.run_command("true")
+        self.assertEqual(len(allocation), 400 * MB)
+        self.assertIsNotNone(usage.max_rss)
+        self.assertLess(usage.max_rss, 50 * 1024)
+
+    def test_peak_includes_the_command_memory(self):
+        allocate = "bytearray(b'\\1') * (200 * 1024 * 1024)"
+        usage = self.run_command(sys.executable, "-c", allocate)
+        self.assertGreater(usage.max_rss, 200 * 1024)
+
+    def test_exit_code_and_output(self):
+        with self.assertRaises(RunErrorException):
+            self.run_command("sh", "-c", "echo 1; exit 3")
+        self.assertEqual(read_usage(self.dir).exit_code, 3)
+        self.assertEqual(self.dir.joinpath(".stdout.stage").read_text(), "1\n")
+
+    def test_timeout_kills_the_command(self):
+        marker = self.dir / "finished"
+        with self.assertRaises(RunErrorException):
+            self.run_command("sh", "-c", f"sleep 2; touch {marker}", timeout=0.5)
+        self.run_command("sleep", "2")
+        self.assertFalse(marker.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()